@@ -0,0 +1,233 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import task0
+import task1
+import task2
+import task3
+from cache import ConversionCache, content_key
+
+
+def convert_task0(in_path, out_path, pretty=True):
+    with open(in_path, 'r') as in_file, open(out_path, 'w') as out_file:
+        task0.convert(in_file, out_file, pretty)
+
+
+def convert_task1(in_path, out_path, pretty=True):
+    with open(in_path, 'r') as in_file, open(out_path, 'w') as out_file:
+        task1.convert(in_file, out_file, pretty)
+
+
+def convert_task2(in_path, out_path, pretty=True):
+    with open(in_path, 'r') as in_file, open(out_path, 'w') as out_file:
+        task2.convert(in_file, out_file, pretty)
+
+
+def convert_task3(in_path, out_path, pretty=True):
+    with open(out_path, 'w') as out_file:
+        task3.dump_xml(task3.iter_documents(in_path), out_file, pretty)
+
+
+ENGINES = {
+    'task0': convert_task0,
+    'task1': convert_task1,
+    'task2': convert_task2,
+    'task3': convert_task3,
+}
+
+
+def find_inputs(source, pattern='*.yaml'):
+    '''
+    Возвращает отсортированный список входных файлов: файлы каталога source,
+    подходящие под pattern, или файлы, подходящие под шаблон source.
+    '''
+
+    if os.path.isdir(source):
+        source = os.path.join(source, pattern)
+
+    return sorted(path for path in glob.glob(source) if os.path.isfile(path))
+
+
+def input_root(in_paths):
+    '''
+    Возвращает общий каталог входных файлов.
+    '''
+
+    if len(in_paths) == 0:
+        return '.'
+
+    return os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in in_paths])
+
+
+def output_path(in_path, out_dir, root):
+    '''
+    Возвращает путь результата: путь входного файла относительно root
+    с расширением .xml внутри out_dir, так что файлы с одинаковыми
+    именами из разных каталогов не перезаписывают друг друга.
+    '''
+
+    name = os.path.splitext(os.path.relpath(os.path.abspath(in_path), root))[0]
+
+    return os.path.join(out_dir, name + '.xml')
+
+
+def output_paths(in_paths, out_dir):
+    '''
+    Возвращает пути результатов для in_paths и создаёт их каталоги.
+    Выбрасывает ValueError, если двум входным файлам соответствует один
+    результат (например, x.yaml и x.yml).
+    '''
+
+    root = input_root(in_paths)
+    out_paths = [output_path(in_path, out_dir, root) for in_path in in_paths]
+
+    seen = {}
+    for in_path, out_path in zip(in_paths, out_paths):
+        other = seen.setdefault(out_path, in_path)
+        if other != in_path:
+            raise ValueError(f'{other} and {in_path} would both be written to {out_path}')
+
+    for out_path in out_paths:
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+
+    return out_paths
+
+
+_cache = None
+
+
+def init_worker(cache_dir=None, cache_size=256 << 20):
+    '''
+    Создаёт кэш рабочего процесса. Дисковый уровень в cache_dir общий
+    для всех процессов пула.
+    '''
+
+    global _cache
+
+    if cache_dir is not None:
+        _cache = ConversionCache(cache_dir=cache_dir, max_bytes=cache_size)
+
+
+def convert_cached(engine, in_path, out_path, pretty=True):
+    '''
+    Преобразует файл через кэш и возвращает True, если результат был
+    взят из кэша.
+    '''
+
+    with open(in_path, 'rb') as in_file:
+        key = content_key(in_file.read(), engine, (pretty,))
+
+    xml = _cache.get(key)
+    if xml is not None:
+        with open(out_path, 'wb') as out_file:
+            out_file.write(xml)
+
+        return True
+
+    ENGINES[engine](in_path, out_path, pretty)
+
+    with open(out_path, 'rb') as out_file:
+        _cache.put(key, out_file.read())
+
+    return False
+
+
+def convert_file(engine, in_path, out_path, pretty=True):
+    '''
+    Преобразует один файл и возвращает четвёрку из пути к нему, времени
+    преобразования в секундах, сообщения об ошибке (None, если её не было)
+    и признака попадания в кэш.
+    '''
+
+    start_time = time.perf_counter()
+
+    cached = False
+    try:
+        if _cache is None:
+            ENGINES[engine](in_path, out_path, pretty)
+        else:
+            cached = convert_cached(engine, in_path, out_path, pretty)
+        error = None
+    except (Exception, SystemExit) as e:
+        error = f'{type(e).__name__}: {e}'
+
+    return (in_path, time.perf_counter() - start_time, error, cached)
+
+
+def convert_all(engine, in_paths, out_dir, jobs=None, cache_dir=None, cache_size=256 << 20,
+        pretty=True):
+    '''
+    Преобразует файлы in_paths в каталог out_dir в пуле из jobs процессов и
+    возвращает результаты convert_file в порядке входных файлов. Если задан
+    cache_dir, неизменившиеся файлы берутся из кэша. Без pretty XML
+    записывается без отступов.
+    '''
+
+    jobs = jobs or os.cpu_count() or 1
+    chunksize = max(1, len(in_paths) // (jobs * 4))
+
+    os.makedirs(out_dir, exist_ok=True)
+    out_paths = output_paths(in_paths, out_dir)
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker,
+            initargs=(cache_dir, cache_size)) as executor:
+        return list(executor.map(convert_file,
+            [engine] * len(in_paths),
+            in_paths,
+            out_paths,
+            [pretty] * len(in_paths),
+            chunksize=chunksize))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Convert a directory of YAML timetables to XML.')
+    parser.add_argument('input', help='input directory or glob pattern')
+    parser.add_argument('output', help='output directory')
+    parser.add_argument('-e', '--engine', choices=ENGINES, default='task3')
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+        help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('-p', '--pattern', default='*.yaml',
+        help='file pattern used when input is a directory')
+    parser.add_argument('-c', '--cache-dir', default=None,
+        help='reuse results for unchanged inputs from this directory')
+    parser.add_argument('--cache-size', type=int, default=256,
+        help='maximum size of the cache directory in MiB')
+    parser.add_argument('--compact', action='store_true',
+        help='write XML without indentation')
+    args = parser.parse_args()
+
+    in_paths = find_inputs(args.input, args.pattern)
+
+    start_time = time.perf_counter()
+    try:
+        results = convert_all(args.engine, in_paths, args.output, args.jobs,
+            args.cache_dir, args.cache_size << 20, not args.compact)
+    except ValueError as e:
+        print(e)
+        exit(1)
+    total_time = time.perf_counter() - start_time
+
+    failures = 0
+    hits = 0
+    for in_path, t, error, cached in results:
+        hits += cached
+        if error is None:
+            print(f'{in_path}: {t * 1000:.1f}ms' + (' (cached)' if cached else ''))
+        else:
+            failures += 1
+            print(f'{in_path}: failed after {t * 1000:.1f}ms: {error}')
+
+    print(f'{len(results) - failures} converted, {failures} failed in {total_time:.2f}s')
+    if args.cache_dir is not None:
+        print(f'cache: {hits} hits, {len(results) - hits} misses')
+
+    if failures != 0:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import collections
+import fcntl
+import hashlib
+import os
+import tempfile
+import threading
+
+
+'''
+Версия формата результатов. Её нужно увеличивать при каждом изменении
+вывода движков или XmlEmitter (например, экранирования), чтобы кэш не
+возвращал XML, записанный прежней версией.
+'''
+FORMAT_VERSION = 2
+
+
+def content_key(data, engine, options=()):
+    '''
+    Возвращает ключ кэша: sha256 от версии формата, содержимого входного
+    файла, имени движка и параметров преобразования.
+    '''
+
+    h = hashlib.sha256()
+    h.update(f'{FORMAT_VERSION}\0{engine}\0'.encode('utf-8'))
+
+    for option in options:
+        h.update(repr(option).encode('utf-8') + b'\0')
+
+    h.update(data)
+
+    return h.hexdigest()
+
+
+class ConversionCache:
+    '''
+    Кэш результатов преобразования, адресуемый по содержимому.
+
+    Значения — байты (например, сериализованный XML). Первый уровень —
+    LRU в памяти процесса на max_entries записей, второй — необязательный
+    каталог cache_dir на диске, суммарный размер которого ограничен
+    max_bytes: при превышении удаляются файлы, к которым дольше всего
+    не обращались (по времени изменения).
+
+    Каталог может использоваться несколькими процессами сразу (например,
+    рабочими процессами batch), поэтому суммарный размер хранится в файле
+    SIZE_FILE каталога и изменяется под блокировкой LOCK_FILE. put только
+    прибавляет размер записанного файла; каталог обходится, лишь когда
+    сумма превысила max_bytes, и тогда файлы удаляются, пока размер не
+    станет меньше EVICT_TO от max_bytes, чтобы следующий обход случился
+    не сразу.
+
+    Счётчики hits, disk_hits и misses доступны через stats().
+    '''
+
+    LOCK_FILE = '.lock'
+    SIZE_FILE = '.size'
+    EVICT_TO = 0.9
+
+    def __init__(self, max_entries=128, cache_dir=None, max_bytes=256 << 20):
+        self._max_entries = max_entries
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self._cache_dir, key)
+
+    def _remember(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        '''
+        Возвращает значение по ключу или None, если его нет ни в одном
+        из уровней кэша.
+        '''
+
+        with self._lock:
+            value = self._entries.get(key)
+
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+        if self._cache_dir is not None:
+            path = self._path(key)
+
+            try:
+                with open(path, 'rb') as f:
+                    value = f.read()
+                os.utime(path)
+            except OSError:
+                value = None
+
+            if value is not None:
+                with self._lock:
+                    self._remember(key, value)
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+
+        if self._cache_dir is None or len(value) > self._max_bytes:
+            return
+
+        '''
+        Файл записывается во временный и затем переименовывается, чтобы
+        процессы, читающие общий каталог, не увидели его частично.
+        '''
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.replace(tmp_path, self._path(key))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+
+        self._add(len(value))
+
+    def _locked(self):
+        '''
+        Возвращает открытый файл блокировки каталога, захваченной
+        монопольно; блокировка снимается при закрытии файла.
+        '''
+
+        f = open(os.path.join(self._cache_dir, self.LOCK_FILE), 'a')
+        fcntl.flock(f, fcntl.LOCK_EX)
+
+        return f
+
+    def _add(self, size):
+        '''
+        Прибавляет size к суммарному размеру каталога и удаляет старые
+        файлы, если он превысил max_bytes.
+        '''
+
+        size_path = os.path.join(self._cache_dir, self.SIZE_FILE)
+
+        with self._locked():
+            try:
+                with open(size_path, 'r') as f:
+                    total = int(f.read()) + size
+            except (OSError, ValueError):
+                total = None
+
+            if total is None or total > self._max_bytes:
+                total = self._evict()
+
+            with open(size_path, 'w') as f:
+                f.write(str(total))
+
+    def _evict(self):
+        '''
+        Обходит каталог и удаляет самые давно использованные файлы, пока
+        их суммарный размер больше EVICT_TO от max_bytes. Возвращает
+        оставшийся размер. Вызывается под блокировкой каталога.
+        '''
+
+        files = []
+        total = 0
+
+        with os.scandir(self._cache_dir) as it:
+            for entry in it:
+                if entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                    continue
+
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+
+                files.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+
+        if total <= self._max_bytes:
+            return total
+
+        files.sort()
+        for mtime, size, path in files:
+            if total <= self._max_bytes * self.EVICT_TO:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+            total -= size
+
+        return total
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+        if self._cache_dir is not None:
+            with self._locked():
+                for name in os.listdir(self._cache_dir):
+                    if name == self.LOCK_FILE:
+                        continue
+
+                    try:
+                        os.remove(self._path(name))
+                    except OSError:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+            }
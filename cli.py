@@ -0,0 +1,147 @@
+import argparse
+import sys
+
+
+'''
+Единая точка входа для всех преобразований. Модули движков импортируются
+внутри обработчиков подкоманд, поэтому каждый запуск загружает только то,
+что нужно выбранной подкоманде: например, convert -e task0 не импортирует
+ни PyYAML, ни task3.
+'''
+
+
+def open_output(out_path, mode='w'):
+    if out_path == '-':
+        return open(sys.stdout.fileno(), mode, closefd=False)
+
+    return open(out_path, mode)
+
+
+def convert_task0(args, instr):
+    import task0
+
+    with open(args.input, 'r') as in_file, open_output(args.output) as out_file:
+        task0.convert(in_file, out_file, not args.compact, instr)
+
+
+def convert_task1(args, instr):
+    import task1
+
+    with open(args.input, 'r') as in_file, open_output(args.output) as out_file:
+        task1.convert(in_file, out_file, not args.compact, instr)
+
+
+def convert_task2(args, instr):
+    import task2
+
+    with open(args.input, 'r') as in_file, open_output(args.output) as out_file:
+        task2.convert(in_file, out_file, not args.compact, instr)
+
+
+def convert_task3(args, instr):
+    import task3
+
+    with open_output(args.output) as out_file:
+        task3.dump_xml(task3.iter_documents(args.input, instr=instr), out_file,
+            not args.compact, instr)
+
+
+CONVERTERS = {
+    'task0': convert_task0,
+    'task1': convert_task1,
+    'task2': convert_task2,
+    'task3': convert_task3,
+}
+
+
+def run_convert(args):
+    if args.profile is None:
+        CONVERTERS[args.engine](args, None)
+        return
+
+    from instrument import Instrument
+
+    instr = Instrument()
+    with instr.phase('total'):
+        CONVERTERS[args.engine](args, instr)
+
+    instr.write(args.profile)
+
+
+def run_csv(args):
+    import task5
+
+    columns = args.columns.split(',') if args.columns else task5.COLUMNS
+
+    with open_output(args.output) as out_file:
+        task5.export_csv(args.input, out_file, columns)
+
+
+def run_incremental(args):
+    import incremental
+
+    converted, total = incremental.update_xml(args.input, args.output)
+    print(f'{converted} of {total} documents converted', file=sys.stderr)
+
+
+def run_snapshot(args):
+    import snapshot
+    import task3
+
+    snapshot.write_snapshot(task3.iter_documents(args.input), args.output)
+
+
+def run_conflicts(args):
+    import conflicts
+
+    conflicts.main(args.input + ['--engine', args.engine])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Convert YAML timetables.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    convert = commands.add_parser('convert', help='convert YAML to XML')
+    convert.add_argument('input')
+    convert.add_argument('output', nargs='?', default='-')
+    convert.add_argument('-e', '--engine', choices=CONVERTERS, default='task3')
+    convert.add_argument('--compact', action='store_true',
+        help='write XML without indentation')
+    convert.add_argument('--profile', metavar='PATH',
+        help='write phase timings and counters to PATH (.prof for cProfile format, JSON otherwise)')
+    convert.set_defaults(run=run_convert)
+
+    csv = commands.add_parser('csv', help='export lessons to CSV')
+    csv.add_argument('input')
+    csv.add_argument('output', nargs='?', default='-')
+    csv.add_argument('-c', '--columns', help='comma-separated list of columns')
+    csv.set_defaults(run=run_csv)
+
+    incremental = commands.add_parser('incremental',
+        help='update an XML file, converting only changed documents')
+    incremental.add_argument('input')
+    incremental.add_argument('output')
+    incremental.set_defaults(run=run_incremental)
+
+    snapshot = commands.add_parser('snapshot', help='write a binary snapshot')
+    snapshot.add_argument('input')
+    snapshot.add_argument('output')
+    snapshot.set_defaults(run=run_snapshot)
+
+    conflicts = commands.add_parser('conflicts',
+        help='find double-booked rooms and teachers')
+    conflicts.add_argument('input', nargs='+')
+    conflicts.add_argument('-e', '--engine', choices=('task1', 'task3'), default='task3')
+    conflicts.set_defaults(run=run_conflicts)
+
+    args = parser.parse_args(argv)
+
+    try:
+        args.run(args)
+    except ValueError as e:
+        print(e)
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
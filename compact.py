@@ -0,0 +1,141 @@
+'''
+Compact read-only document tree for YamlParser output.
+
+A CompactDict stores its values in a tuple next to a shape: the tuple of
+keys and a dict from each key to its position. The shape is shared by
+every dictionary with the same keys in the same order, so the thousands
+of lesson records of a timetable hold one copy of ('lesson', 'type', ...)
+and look keys up by hash like a dict. A CompactList wraps a tuple.
+Strings are interned per builder, so repeated values such as lesson types
+and buildings are stored once. Nodes implement Mapping and Sequence, so consumers that only
+read the tree can use them in place of dict and list.
+'''
+
+
+from collections.abc import Mapping, Sequence
+
+
+class _Shape:
+    __slots__ = ('keys', 'index')
+
+    def __init__(self, keys):
+        self.keys = keys
+        self.index = {k: i for i, k in enumerate(keys)}
+
+    def __reduce__(self):
+        return (_Shape, (self.keys,))
+
+
+class CompactDict(Mapping):
+    __slots__ = ('_shape', '_values')
+
+    def __init__(self, shape, values):
+        self._shape = shape
+        self._values = values
+
+    def __getitem__(self, key):
+        try:
+            return self._values[self._shape.index[key]]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __iter__(self):
+        return iter(self._shape.keys)
+
+    def __len__(self):
+        return len(self._shape.keys)
+
+    def __contains__(self, key):
+        return key in self._shape.index
+
+    def keys(self):
+        return self._shape.keys
+
+    def values(self):
+        return self._values
+
+    def items(self):
+        return zip(self._shape.keys, self._values)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactDict):
+            return self._shape.keys == other._shape.keys and self._values == other._values
+
+        return Mapping.__eq__(self, other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __reduce__(self):
+        return (CompactDict, (self._shape, self._values))
+
+
+class CompactList(Sequence):
+    __slots__ = ('_items',)
+
+    def __init__(self, items):
+        self._items = items
+
+    def __getitem__(self, i):
+        return self._items[i]
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __eq__(self, other):
+        if isinstance(other, CompactList):
+            return self._items == other._items
+
+        if isinstance(other, (list, tuple)):
+            return self._items == tuple(other)
+
+        return NotImplemented
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self._items))
+
+    def __reduce__(self):
+        return (CompactList, (self._items,))
+
+
+class CompactBuilder:
+    '''
+    Turns the dicts and lists built by the parser into compact nodes,
+    interning keys, key tuples and string values.
+    '''
+
+    def __init__(self):
+        self._strings = {}
+        self._shapes = {}
+
+    def string(self, s):
+        return self._strings.setdefault(s, s)
+
+    def value(self, v):
+        if type(v) is str:
+            return self._strings.setdefault(v, v)
+        if type(v) is dict:
+            return self.dict(v)
+        if type(v) is list:
+            return self.list(v)
+
+        return v
+
+    def dict(self, entries):
+        keys = tuple(map(self.string, entries))
+
+        shape = self._shapes.get(keys)
+        if shape is None:
+            shape = self._shapes[keys] = _Shape(keys)
+
+        return CompactDict(shape, tuple(map(self.value, entries.values())))
+
+    def list(self, entries):
+        return CompactList(tuple(map(self.value, entries)))
@@ -0,0 +1,161 @@
+import argparse
+import heapq
+from collections import defaultdict, namedtuple
+
+import task1
+import task3
+from task5 import EVEN_WEEK, ODD_WEEK, iter_lessons, parse_time, parse_weeks
+
+
+'''
+Пересечение двух занятий: kind — 'room' или 'teacher', value — пара из
+корпуса и аудитории или преподаватель, weeks — маска чётности недель, в которые занятия
+пересекаются, first и second — индексы занятий в списке lessons.
+'''
+Conflict = namedtuple('Conflict', ['kind', 'value', 'day', 'weeks', 'first', 'second'])
+
+'''
+Занятие, приведённое к общему виду: значения PyYAML (числа) и YamlParser
+(строки) сравниваются как строки.
+'''
+Lesson = namedtuple('Lesson',
+    ['day', 'start', 'end', 'weeks', 'building', 'room', 'teacher', 'data'])
+
+
+def normalize_lessons(documents):
+    lessons = []
+
+    for day, lesson in iter_lessons(documents):
+        lessons.append(Lesson(
+            str(day),
+            parse_time(lesson['start']),
+            parse_time(lesson['end']),
+            parse_weeks(lesson.get('weeks', ())),
+            str(lesson.get('building', '')),
+            str(lesson.get('room', '')),
+            str(lesson.get('teacher', '')),
+            lesson,
+        ))
+
+    return lessons
+
+
+def overlapping_pairs(intervals):
+    '''
+    Возвращает пары индексов пересекающихся интервалов (start, end, index)
+    методом заметающей прямой: интервалы сортируются по началу, а концы
+    начатых интервалов хранятся в куче. Время работы — O(n log n + k),
+    где k — число пар. Интервалы, которые только касаются друг друга,
+    не пересекаются.
+    '''
+
+    intervals.sort()
+    active = []
+
+    for start, end, i in intervals:
+        while len(active) != 0 and active[0][0] <= start:
+            heapq.heappop(active)
+
+        for _, j in active:
+            yield (j, i)
+
+        heapq.heappush(active, (end, i))
+
+
+def find_conflicts(documents):
+    '''
+    Находит занятия, которые проходят в одной аудитории (одного корпуса)
+    или у одного преподавателя в один день и одну чётность недели и пересекаются по
+    времени. Возвращает список занятий и список Conflict.
+    '''
+
+    lessons = normalize_lessons(documents)
+
+    groups = defaultdict(list)
+    for i, lesson in enumerate(lessons):
+        for parity in (EVEN_WEEK, ODD_WEEK):
+            if lesson.weeks & parity == 0:
+                continue
+
+            if lesson.room != '':
+                groups[('room', (lesson.building, lesson.room), lesson.day, parity)].append(
+                    (lesson.start, lesson.end, i))
+            if lesson.teacher != '':
+                groups[('teacher', lesson.teacher, lesson.day, parity)].append(
+                    (lesson.start, lesson.end, i))
+
+    '''
+    Занятие обеих чётностей попадает в две группы, поэтому одна и та же
+    пара объединяется по маске недель.
+    '''
+    found = {}
+    for (kind, value, day, parity), intervals in groups.items():
+        for first, second in overlapping_pairs(intervals):
+            key = (kind, value, min(first, second), max(first, second))
+            found[key] = found.get(key, 0) | parity
+
+    conflicts = [Conflict(kind, value, lessons[first].day, weeks, first, second)
+        for (kind, value, first, second), weeks in found.items()]
+    conflicts.sort(key=lambda c: (c.kind, c.value, c.first, c.second))
+
+    return lessons, conflicts
+
+
+def load_documents(in_path, engine):
+    '''
+    Возвращает итератор документов файла in_path. Документы разбираются
+    по одному, так что файл не читается целиком.
+    '''
+
+    if engine == 'task1':
+        import yaml
+
+        with open(in_path, 'r') as in_file:
+            yield from yaml.load_all(in_file, Loader=task1._loader())
+    else:
+        yield from task3.iter_documents(in_path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Find double-booked rooms and teachers in timetables.')
+    parser.add_argument('input', nargs='+', help='YAML timetables')
+    parser.add_argument('-e', '--engine', choices=('task1', 'task3'), default='task3')
+    args = parser.parse_args(argv)
+
+    def documents():
+        for in_path in args.input:
+            yield from load_documents(in_path, args.engine)
+
+    errors = (task3.YamlError,)
+    if args.engine == 'task1':
+        import yaml
+        errors += (yaml.YAMLError,)
+
+    try:
+        lessons, conflicts = find_conflicts(documents())
+    except errors as e:
+        print(e)
+        exit(1)
+
+    for c in conflicts:
+        first = lessons[c.first]
+        second = lessons[c.second]
+        weeks = ', '.join(name for name, bit in
+            (('even', EVEN_WEEK), ('odd', ODD_WEEK)) if c.weeks & bit)
+
+        if c.kind == 'room':
+            building, room = c.value
+            place = f'room {room}' + (f' ({building})' if building != '' else '')
+        else:
+            place = f'teacher {c.value}'
+
+        print(f'{place}, {c.day} ({weeks} weeks): '
+            f'{first.data.get("lesson")} {first.start // 60}:{first.start % 60:02} '
+            f'and {second.data.get("lesson")} {second.start // 60}:{second.start % 60:02}')
+
+    print(f'{len(conflicts)} conflicts in {len(lessons)} lessons')
+
+
+if __name__ == '__main__':
+    main()
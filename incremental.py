@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+import stat
+import sys
+import tempfile
+
+import task3
+from writer import XML_DECLARATION, XmlEmitter
+
+
+'''
+Инкрементальное преобразование многодокументного YAML-файла движком task3.
+
+Рядом с выходным файлом хранится манифест: хэши входных документов и
+байтовые диапазоны соответствующих им блоков <document> в выходном файле.
+При повторном запуске разбираются только документы, которых нет в
+манифесте, а блоки остальных копируются из прежнего результата. Манифест
+хранит и sha256 выходного файла, так что результат, перезаписанный
+другим способом (например, task3.main), не используется.
+'''
+
+
+def manifest_path(out_path):
+    return out_path + '.manifest.json'
+
+
+def load_manifest(path, out_path):
+    '''
+    Возвращает пару из манифеста и содержимого выходного файла или None,
+    если манифеста нет, он повреждён или не соответствует текущему
+    выходному файлу.
+    '''
+
+    try:
+        with open(path, 'r') as f:
+            manifest = json.load(f)
+
+        with open(out_path, 'rb') as out_file:
+            xml = out_file.read()
+
+        if manifest['sha256'] != hashlib.sha256(xml).hexdigest():
+            return None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+    return manifest, xml
+
+
+'''
+umask процесса. os.umask нельзя прочитать, не изменив его, поэтому он
+читается один раз при импорте, а не при каждой записи, когда другие
+потоки могут создавать файлы.
+'''
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _write_atomic(path, data, mode='wb'):
+    '''
+    Записывает data во временный файл и переименовывает его в path.
+    Права доступа берутся у прежнего файла, а у нового файла — по umask,
+    как у файла, созданного open(), а не 0600 от mkstemp.
+    '''
+
+    try:
+        file_mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        file_mode = 0o666 & ~_UMASK
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.chmod(tmp_path, file_mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def convert_document(chunk, line):
+    '''
+    Преобразует один документ и возвращает байты его блока <document>.
+    '''
+
+    block = bytearray()
+    with XmlEmitter(block, depth=1) as out:
+        for doc in task3.YamlParser().parse(chunk, line_offset=line):
+            task3.dump_document(doc, out)
+
+    return bytes(block)
+
+
+def update_xml(in_path, out_path, manifest_file=None):
+    '''
+    Обновляет out_path по in_path, заново преобразуя только изменившиеся
+    документы. Возвращает пару из числа преобразованных и общего числа
+    документов.
+    '''
+
+    manifest_file = manifest_file or manifest_path(out_path)
+
+    with open(in_path, 'rb') as in_file:
+        data = in_file.read()
+
+    old_blocks = {}
+    previous = load_manifest(manifest_file, out_path)
+    if previous is not None:
+        manifest, old_xml = previous
+
+        for h, (start, end) in zip(manifest['documents'], manifest['spans']):
+            old_blocks[h] = old_xml[start:end]
+
+    header = (XML_DECLARATION + '<root>\n').encode('utf-8')
+    footer = b'</root>\n'
+
+    parts = [header]
+    hashes = []
+    spans = []
+    offset = len(header)
+    converted = 0
+
+    for line, chunk in task3.split_documents(data):
+        h = hashlib.sha256(chunk).hexdigest()
+
+        block = old_blocks.get(h)
+        if block is None:
+            block = convert_document(chunk, line)
+            old_blocks[h] = block
+            converted += 1
+
+        parts.append(block)
+        hashes.append(h)
+        spans.append((offset, offset + len(block)))
+        offset += len(block)
+
+    parts.append(footer)
+
+    xml = b''.join(parts)
+
+    _write_atomic(out_path, xml)
+    _write_atomic(manifest_file, json.dumps({
+        'sha256': hashlib.sha256(xml).hexdigest(),
+        'documents': hashes,
+        'spans': spans,
+    }), 'w')
+
+    return (converted, len(hashes))
+
+
+def main(in_path='input/timetable_task3.yaml', out_path='output/task3.xml'):
+    try:
+        converted, total = update_xml(in_path, out_path)
+    except task3.YamlError as e:
+        print(e)
+        exit(1)
+
+    print(f'{converted} of {total} documents converted')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
@@ -0,0 +1,104 @@
+import json
+import marshal
+import time
+
+
+class Instrument:
+    '''
+    Сбор статистики преобразования: время фаз, счётчики и объём вывода.
+
+    Парсер, преобразователи и запись XML принимают необязательный
+    параметр instr. Если он равен None, они работают как обычно и не
+    тратят время на измерения; иначе фазы оборачиваются в timed() или
+    phase(), а счётчики увеличиваются через count().
+
+    Время фазы включает время вложенных в неё фаз: например, read входит
+    в parse.
+    '''
+
+    def __init__(self):
+        self.phases = {}
+        self.counters = {}
+
+    def _add(self, name, elapsed, calls=1):
+        total, n = self.phases.get(name, (0.0, 0))
+        self.phases[name] = (total + elapsed, n + calls)
+
+    def phase(self, name):
+        '''
+        Возвращает контекстный менеджер, который добавляет время своего
+        блока к фазе name.
+        '''
+
+        return _Phase(self, name)
+
+    def timed(self, name, fn):
+        '''
+        Возвращает обёртку над fn, которая добавляет время каждого вызова
+        к фазе name.
+        '''
+
+        perf_counter = time.perf_counter
+        phases = self.phases
+
+        def wrapper(*args):
+            start = perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                total, n = phases.get(name, (0.0, 0))
+                phases[name] = (total + perf_counter() - start, n + 1)
+
+        return wrapper
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def report(self):
+        return {
+            'phases': {name: {'time': t, 'calls': n} for name, (t, n) in self.phases.items()},
+            'counters': dict(self.counters),
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.report(), f, indent=4)
+
+    def write_pstats(self, path):
+        '''
+        Записывает фазы в формате файла статистики cProfile, который
+        читают pstats.Stats и визуализаторы профилей. Каждая фаза —
+        функция ('instrument', 0, name) с одинаковым собственным и
+        накопленным временем.
+        '''
+
+        stats = {('instrument', 0, name): (n, n, t, t, {})
+            for name, (t, n) in self.phases.items()}
+
+        with open(path, 'wb') as f:
+            marshal.dump(stats, f)
+
+    def write(self, path):
+        '''
+        Записывает статистику в path: в формате cProfile, если имя
+        оканчивается на .prof или .pstats, иначе в JSON.
+        '''
+
+        if path.endswith(('.prof', '.pstats')):
+            self.write_pstats(path)
+        else:
+            self.write_json(path)
+
+
+class _Phase:
+    __slots__ = ('_instr', '_name', '_start')
+
+    def __init__(self, instr, name):
+        self._instr = instr
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self._instr._add(self._name, time.perf_counter() - self._start)
@@ -0,0 +1,406 @@
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping, Sequence
+
+import task3
+
+
+'''
+Двоичный снимок разобранных документов.
+
+Все числа — little-endian. Файл начинается с заголовка HEADER: сигнатура
+MAGIC, версия, число строк, смещение таблицы строк и смещение узла со
+списком документов. Таблица строк — count + 1 смещений u64 и следом
+данные строк в UTF-8; строка i занимает байты между смещениями i и i + 1.
+Смещения читаются из отображения по мере обращения к строкам, поэтому
+открытие снимка не зависит от числа строк.
+
+Узел словаря — тег b'D', число элементов u32, элементы из индекса ключа
+в таблице строк (u32) и значения в исходном порядке и следом номера
+элементов (u32), упорядоченные по байтам ключей, по которым ключ ищется
+двоичным поиском. Ключи — только строки. Узел списка — тег b'L', число
+элементов u32 и значения. Значение — вид (u8) и 8 байт: индекс строки,
+смещение узла, целое, вещественное или логическое значение. Элементы
+имеют постоянный размер, поэтому i-й элемент читается без разбора
+предыдущих.
+
+Узлы записываются раньше ссылающихся на них, а узел, на который ссылаются
+несколько раз (один и тот же объект), записывается один раз.
+'''
+
+MAGIC = b'YSNP'
+VERSION = 3
+
+HEADER = struct.Struct('<4sHHIQQ')
+COUNT = struct.Struct('<I')
+VALUE = struct.Struct('<BQ')
+ENTRY = struct.Struct('<IBQ')
+INDEX = struct.Struct('<I')
+OFFSET = struct.Struct('<Q')
+SPAN = struct.Struct('<QQ')
+INT = struct.Struct('<q')
+FLOAT = struct.Struct('<d')
+
+NONE = 0
+STRING = 1
+NODE = 2
+INT_VALUE = 3
+FLOAT_VALUE = 4
+BOOL_VALUE = 5
+
+DICT_TAG = b'D'
+LIST_TAG = b'L'
+
+
+class SnapshotError(ValueError):
+    pass
+
+
+class _Writer:
+    def __init__(self, f):
+        self._f = f
+        self._offset = HEADER.size
+        self._strings = {}
+        self._nodes = {}
+
+        f.write(b'\0' * HEADER.size)
+
+    def string(self, s):
+        return self._strings.setdefault(s, len(self._strings))
+
+    def value(self, v):
+        if v is None:
+            return (NONE, 0)
+        if isinstance(v, str):
+            return (STRING, self.string(v))
+        if isinstance(v, bool):
+            return (BOOL_VALUE, int(v))
+        if isinstance(v, int):
+            try:
+                return (INT_VALUE, int.from_bytes(INT.pack(v), 'little'))
+            except struct.error:
+                raise SnapshotError(f'Integer {v} does not fit in 64 bits') from None
+        if isinstance(v, float):
+            return (FLOAT_VALUE, int.from_bytes(FLOAT.pack(v), 'little'))
+        if isinstance(v, (Mapping, Sequence)):
+            return (NODE, self.node(v))
+
+        raise TypeError(f'Unsupported value type: {type(v).__name__}')
+
+    def node(self, data):
+        offset = self._nodes.get(id(data))
+        if offset is not None:
+            return offset[0]
+
+        if isinstance(data, Mapping):
+            items = list(data.items())
+            for k, v in items:
+                if not isinstance(k, str):
+                    raise TypeError(f'Unsupported key type: {type(k).__name__}')
+
+            entries = [(self.string(k),) + self.value(v) for k, v in items]
+
+            '''
+            Строки упорядочены по кодовым точкам так же, как их байты
+            в UTF-8, поэтому ключи сравниваются без кодирования.
+            '''
+            order = sorted(range(len(items)), key=lambda i: items[i][0])
+
+            chunk = [DICT_TAG, COUNT.pack(len(entries))]
+            chunk.extend(ENTRY.pack(*entry) for entry in entries)
+            chunk.append(struct.pack(f'<{len(order)}I', *order))
+        else:
+            values = [self.value(v) for v in data]
+            chunk = [LIST_TAG, COUNT.pack(len(values))]
+            chunk.extend(VALUE.pack(*value) for value in values)
+
+        chunk = b''.join(chunk)
+        offset = self._offset
+        self._f.write(chunk)
+        self._offset += len(chunk)
+
+        '''
+        Объект хранится вместе со смещением, чтобы его id не был
+        переиспользован другим объектом до конца записи.
+        '''
+        self._nodes[id(data)] = (offset, data)
+
+        return offset
+
+    def finish(self, documents):
+        root = self.node(documents)
+
+        strings_offset = self._offset
+        data = [s.encode('utf-8') for s in self._strings]
+
+        offsets = [0]
+        for s in data:
+            offsets.append(offsets[-1] + len(s))
+
+        self._f.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+        self._f.write(b''.join(data))
+
+        self._f.seek(0)
+        self._f.write(HEADER.pack(MAGIC, VERSION, 0, len(data), strings_offset, root))
+
+
+def write_snapshot(documents, path):
+    '''
+    Записывает документы (dict/list или любые Mapping/Sequence) в снимок.
+    Ключи словарей должны быть строками, иначе выбрасывается TypeError.
+    Файл записывается во временный и затем переименовывается; если запись
+    не удалась, временный файл удаляется, а прежний снимок остаётся.
+    Выбрасывает SnapshotError для значений, которые нельзя записать.
+    '''
+
+    tmp_path = path + '.tmp'
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            _Writer(f).finish(list(documents))
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class Snapshot:
+    '''
+    Снимок, отображённый в память. documents — список документов в виде
+    представлений SnapshotDict и SnapshotList, которые читают узлы прямо
+    из отображения при обращении к ним; строки декодируются при первом
+    обращении. Представления действительны до close().
+    '''
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+
+        try:
+            self._buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise SnapshotError(f'{path}: empty snapshot') from None
+
+        try:
+            magic, version, flags, count, strings_offset, root = \
+                HEADER.unpack_from(self._buf, 0)
+        except struct.error:
+            self.close()
+            raise SnapshotError(f'{path}: truncated snapshot') from None
+
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise SnapshotError(f'{path}: not a snapshot of version {VERSION}')
+
+        self._string_offsets = strings_offset
+        self._strings_data = strings_offset + (count + 1) * OFFSET.size
+        self._strings = {}
+
+        self.documents = self._node(root)
+
+    def _span(self, i):
+        start, end = SPAN.unpack_from(self._buf, self._string_offsets + i * OFFSET.size)
+
+        return self._strings_data + start, self._strings_data + end
+
+    def string(self, i):
+        s = self._strings.get(i)
+
+        if s is None:
+            start, end = self._span(i)
+            s = self._strings[i] = str(self._buf[start:end], 'utf-8')
+
+        return s
+
+    def string_bytes(self, i):
+        start, end = self._span(i)
+
+        return self._buf[start:end]
+
+    def _node(self, offset):
+        tag = self._buf[offset:offset + 1]
+        n = COUNT.unpack_from(self._buf, offset + 1)[0]
+
+        if tag == DICT_TAG:
+            return SnapshotDict(self, offset + 1 + COUNT.size, n)
+        if tag == LIST_TAG:
+            return SnapshotList(self, offset + 1 + COUNT.size, n)
+
+        raise SnapshotError(f'Unknown node at offset {offset}')
+
+    def _value(self, kind, v):
+        if kind == STRING:
+            return self.string(v)
+        if kind == NODE:
+            return self._node(v)
+        if kind == NONE:
+            return None
+        if kind == INT_VALUE:
+            return INT.unpack(v.to_bytes(8, 'little'))[0]
+        if kind == FLOAT_VALUE:
+            return FLOAT.unpack(v.to_bytes(8, 'little'))[0]
+        if kind == BOOL_VALUE:
+            return v != 0
+
+        raise SnapshotError(f'Unknown value kind {kind}')
+
+    def close(self):
+        if self._buf is not None:
+            self._buf.close()
+            self._buf = None
+
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SnapshotDict(Mapping):
+    __slots__ = ('_snapshot', '_start', '_len')
+
+    def __init__(self, snapshot, start, n):
+        self._snapshot = snapshot
+        self._start = start
+        self._len = n
+
+    def _entry(self, i):
+        return ENTRY.unpack_from(self._snapshot._buf, self._start + i * ENTRY.size)
+
+    def __getitem__(self, key):
+        '''
+        Ищет ключ двоичным поиском по упорядоченным номерам элементов,
+        сравнивая байты строк, без декодирования остальных ключей.
+        '''
+
+        if not isinstance(key, str):
+            raise KeyError(key)
+
+        snapshot = self._snapshot
+        encoded = key.encode('utf-8')
+        index = self._start + self._len * ENTRY.size
+
+        lo = 0
+        hi = self._len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            k, kind, v = self._entry(INDEX.unpack_from(snapshot._buf, index + mid * INDEX.size)[0])
+            s = snapshot.string_bytes(k)
+
+            if s < encoded:
+                lo = mid + 1
+            elif s > encoded:
+                hi = mid
+            else:
+                return snapshot._value(kind, v)
+
+        raise KeyError(key)
+
+    def __iter__(self):
+        for i in range(self._len):
+            yield self._snapshot.string(self._entry(i)[0])
+
+    def __len__(self):
+        return self._len
+
+    def items(self):
+        snapshot = self._snapshot
+
+        for i in range(self._len):
+            k, kind, v = self._entry(i)
+            yield (snapshot.string(k), snapshot._value(kind, v))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class SnapshotList(Sequence):
+    __slots__ = ('_snapshot', '_start', '_len')
+
+    def __init__(self, snapshot, start, n):
+        self._snapshot = snapshot
+        self._start = start
+        self._len = n
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(self._len))]
+
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError('snapshot list index out of range')
+
+        kind, v = VALUE.unpack_from(self._snapshot._buf, self._start + i * VALUE.size)
+
+        return self._snapshot._value(kind, v)
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def to_python(data):
+    '''
+    Полностью переводит представления снимка в dict и list.
+    '''
+
+    if isinstance(data, Mapping):
+        return {k: to_python(v) for k, v in data.items()}
+    if isinstance(data, Sequence) and not isinstance(data, str):
+        return [to_python(v) for v in data]
+
+    return data
+
+
+def open_cached(in_path, snap_path=None):
+    '''
+    Возвращает Snapshot для YAML-файла in_path. Если снимка нет, он
+    старше файла или записан другой версией формата, файл разбирается
+    движком task3 и снимок записывается заново.
+    '''
+
+    snap_path = snap_path or in_path + '.snap'
+
+    try:
+        fresh = os.path.getmtime(snap_path) >= os.path.getmtime(in_path)
+    except OSError:
+        fresh = False
+
+    if fresh:
+        try:
+            return Snapshot(snap_path)
+        except SnapshotError:
+            pass
+
+    write_snapshot(task3.iter_documents(in_path), snap_path)
+
+    return Snapshot(snap_path)
+
+
+def main(in_path='input/timetable_task3.yaml', snap_path=None):
+    snap_path = snap_path or os.path.splitext(in_path)[0] + '.snap'
+
+    try:
+        write_snapshot(task3.iter_documents(in_path), snap_path)
+    except (task3.YamlError, SnapshotError) as e:
+        print(e)
+        exit(1)
+
+    with Snapshot(snap_path) as snapshot:
+        print(f'{snap_path}: {len(snapshot.documents)} documents, '
+            f'{os.path.getsize(snap_path)} bytes')
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:3])
@@ -0,0 +1,199 @@
+import numpy as np
+
+import task3
+from task5 import EVEN_WEEK, ODD_WEEK, iter_lessons, parse_time, parse_weeks
+
+
+CATEGORICAL = ('day', 'lesson', 'type', 'teacher', 'building', 'room')
+
+
+class LessonTable:
+    '''
+    Таблица занятий в виде столбцов NumPy.
+
+    Строковые столбцы (CATEGORICAL) хранятся кодами int32 и списком
+    категорий: categories[name][codes[name][i]] — значение i-й строки.
+    Время начала и конца хранится в минутах (start, end), чётность недель —
+    маской EVEN_WEEK | ODD_WEEK (weeks).
+    '''
+
+    def __init__(self, codes, categories, start, end, weeks):
+        self.codes = codes
+        self.categories = categories
+        self.start = start
+        self.end = end
+        self.weeks = weeks
+
+    @classmethod
+    def from_documents(cls, documents):
+        '''
+        Строит таблицу по документам расписания, полученным от
+        YamlParser или от PyYAML (task1).
+        '''
+
+        lookups = {name: {} for name in CATEGORICAL}
+        codes = {name: [] for name in CATEGORICAL}
+        start = []
+        end = []
+        weeks = []
+
+        for day, lesson in iter_lessons(documents):
+            for name in CATEGORICAL:
+                v = day if name == 'day' else lesson.get(name, '')
+                lookup = lookups[name]
+                codes[name].append(lookup.setdefault(str(v), len(lookup)))
+
+            start.append(parse_time(lesson['start']))
+            end.append(parse_time(lesson['end']))
+            weeks.append(parse_weeks(lesson.get('weeks', ())))
+
+        return cls(
+            {name: np.array(codes[name], dtype=np.int32) for name in CATEGORICAL},
+            {name: list(lookups[name]) for name in CATEGORICAL},
+            np.array(start, dtype=np.int16),
+            np.array(end, dtype=np.int16),
+            np.array(weeks, dtype=np.uint8),
+        )
+
+    def __len__(self):
+        return len(self.start)
+
+    def column(self, name):
+        '''
+        Возвращает столбец: коды категориального столбца или массив
+        start, end, weeks.
+        '''
+
+        if name in self.codes:
+            return self.codes[name]
+
+        return getattr(self, name)
+
+    def decode(self, name, codes):
+        '''
+        Возвращает значения категориального столбца name для кодов codes.
+        '''
+
+        return np.array(self.categories[name], dtype=object)[codes]
+
+    def code(self, name, value):
+        '''
+        Возвращает код значения столбца name или -1, если его нет.
+        '''
+
+        try:
+            return self.categories[name].index(value)
+        except ValueError:
+            return -1
+
+    def where(self, weeks=None, **conditions):
+        '''
+        Возвращает маску строк, у которых столбцы равны заданным значениям,
+        например where(day='Пятница', room='2337'). weeks задаёт маску
+        чётности, с которой должны пересекаться недели занятия.
+        '''
+
+        mask = np.ones(len(self), dtype=bool)
+
+        for name, value in conditions.items():
+            if name in self.codes:
+                mask &= self.codes[name] == self.code(name, value)
+            else:
+                mask &= self.column(name) == value
+
+        if weeks is not None:
+            mask &= (self.weeks & weeks) != 0
+
+        return mask
+
+    def filter(self, mask):
+        '''
+        Возвращает таблицу из строк, выбранных маской или индексами.
+        '''
+
+        return LessonTable(
+            {name: codes[mask] for name, codes in self.codes.items()},
+            self.categories,
+            self.start[mask],
+            self.end[mask],
+            self.weeks[mask],
+        )
+
+    def _group_keys(self, keys):
+        '''
+        Объединяет столбцы keys в один ключ int64 и возвращает его вместе
+        с основаниями разрядов.
+        '''
+
+        key = np.zeros(len(self), dtype=np.int64)
+        sizes = []
+
+        for name in keys:
+            column = self.column(name).astype(np.int64)
+            size = int(column.max()) + 1 if len(column) != 0 else 1
+
+            key = key * size + column
+            sizes.append(size)
+
+        return key, sizes
+
+    def group_count(self, *keys):
+        '''
+        Считает строки в группах по столбцам keys. Возвращает словарь из
+        массивов значений ключевых столбцов (кодов для категориальных)
+        и массив count.
+        '''
+
+        key, sizes = self._group_keys(keys)
+        unique, counts = np.unique(key, return_counts=True)
+
+        result = {}
+        for name, size in zip(reversed(keys), reversed(sizes)):
+            result[name] = unique % size
+            unique = unique // size
+
+        result['count'] = counts
+
+        return result
+
+    def busiest_rooms(self):
+        '''
+        Для каждого слота (день, начало занятия) находит аудиторию с
+        наибольшим числом занятий. Аудитория — пара (корпус, номер), так
+        что одинаковые номера в разных корпусах считаются отдельно.
+        Возвращает словарь массивов day, start, building, room и count.
+        '''
+
+        groups = self.group_count('day', 'start', 'building', 'room')
+
+        order = np.lexsort((-groups['count'], groups['start'], groups['day']))
+        day = groups['day'][order]
+        start = groups['start'][order]
+
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (day[1:] != day[:-1]) | (start[1:] != start[:-1])
+        first = order[first]
+
+        return {name: groups[name][first] for name in ('day', 'start', 'building', 'room', 'count')}
+
+    def teacher_load(self):
+        '''
+        Возвращает массив числа занятий каждого преподавателя (по кодам)
+        в чётные и нечётные недели, формы (число преподавателей, 2).
+        '''
+
+        teachers = self.codes['teacher']
+        n = len(self.categories['teacher'])
+
+        return np.stack([
+            np.bincount(teachers, weights=(self.weeks & EVEN_WEEK) != 0, minlength=n),
+            np.bincount(teachers, weights=(self.weeks & ODD_WEEK) != 0, minlength=n),
+        ], axis=1).astype(np.int64)
+
+
+def load_table(source, use_mmap=False):
+    '''
+    Разбирает YAML-файл движком task3 и возвращает LessonTable.
+    '''
+
+    return LessonTable.from_documents(task3.iter_documents(source, use_mmap))
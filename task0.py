@@ -1,3 +1,8 @@
+from collections import namedtuple
+
+from writer import XmlEmitter
+
+
 def get_indent(s):
     '''
     Возвращает отступ элемента.
@@ -41,21 +46,6 @@ def is_list_entry(indent):
     return indent.strip().startswith('-')
 
 
-def indent_exists(indent):
-    '''
-    Проверяет, встречались ли элементы с данным отступом.
-    '''
-    
-    global indents, opened, out_file
-
-    for other in indents:
-        if get_nb_spaces(indent) == get_nb_spaces(other) and \
-                is_list_entry(indent) == is_list_entry(other):
-            return True
-
-    return False
-
-
 def parse_string(s):
     if (s[0] == '\'' and s[-1] == '\'') or (s[0] == '"' and s[-1] == '"'):
         return s[1:-1]
@@ -63,145 +53,230 @@ def parse_string(s):
     return s
 
 
-def paste_list_entry(line):
-    '''
-    Вставляет в выходной файл элемент списка.
-    '''
+def is_line_skippable(line):
+    line = line.rstrip()
 
-    global indents, opened, out_file
+    return line == '---' or line == '...' or line == ''
 
-    indent = get_indent(line)
-    value = line[len(indent):].strip()
 
-    if value[0] == '[' and value[-1] == ']':
-        values = map(str.strip, value[1:-1].split(','))
-        for v in map(parse_string, values):
-            out_file.write('    ' * (len(opened) + 1) + f'<value>{v}</value>\n')
-    else:
-        out_file.write('    ' * (len(opened) + 1) + f'{parse_string(value)}\n')
+'''
+Строка YAML, разобранная один раз: число пробелов перед элементом, признак
+элемента списка, вид строки (DICT_ENTRY или SCALAR), ключ и значение.
+'''
+Line = namedtuple('Line', ['indent', 'is_list', 'kind', 'key', 'value'])
 
+DICT_ENTRY = 'dict'
+SCALAR = 'scalar'
 
-def paste_element(key, value):
+
+class Converter:
     '''
-    Вставляет в выходной файл элемент XML, полученный из элемента словаря YAML.
+    Преобразователь YAML в XML. Всё состояние разбора хранится в самом
+    объекте, поэтому разные преобразователи можно использовать одновременно
+    из нескольких потоков.
     '''
 
-    global indents, opened, out_file
+    get_indent = staticmethod(get_indent)
+    get_nb_spaces = staticmethod(get_nb_spaces)
+    is_dict_entry = staticmethod(is_dict_entry)
+    is_list_entry = staticmethod(is_list_entry)
+    parse_string = staticmethod(parse_string)
+    is_line_skippable = staticmethod(is_line_skippable)
+
+    def __init__(self, out_file, pretty=True, instr=None):
+        self._out = XmlEmitter(out_file, pretty, instr=instr)
+        self._instr = instr
+        self._indents = []
+        self._levels = set()
+        self._opened = []
+
+    def tokenize(self, line):
+        '''
+        Разбирает строку YAML в Line или возвращает None, если строку
+        нужно пропустить.
+        '''
 
-    if value[0] == '[' and value[-1] == ']':
-        if len(value[1:-1].strip()) == 0:
-            out_file.write('    ' * (len(opened) + 1) + f'<{key}></{key}>\n')
-        else:
-            values = list(map(str.strip, value[1:-1].split(',')))
+        if self.is_line_skippable(line):
+            return None
 
-            out_file.write('    ' * (len(opened) + 1) + f'<{key}>\n')
-            for v in map(parse_string, values):
-                out_file.write('    ' * (len(opened) + 2) + f'<value>{v}</value>\n')
-            out_file.write('    ' * (len(opened) + 1) + f'</{key}>\n')
-    else:
-        out_file.write('    ' * (len(opened) + 1) + \
-            f'<{key}>{parse_string(value)}</{key}>\n')
+        indent = self.get_indent(line)
+        nb_spaces = self.get_nb_spaces(indent)
+        is_list = self.is_list_entry(indent)
 
+        if self.is_dict_entry(line):
+            key, value = map(str.strip, line[len(indent):].split(':', 1))
 
-def open_element(elem, indent):
-    '''
-    Открывает элемент XML, который будет закрыт при нахождении другого элемента
-    с данным отступом или при достижении конца файла.
-    '''
+            return Line(nb_spaces, is_list, DICT_ENTRY, key, value)
 
-    global indents, opened, out_file
+        return Line(nb_spaces, is_list, SCALAR, None, line[len(indent):].strip())
 
-    opened.append((elem, indent))
-    out_file.write('    ' * len(opened) + f'<{elem}>\n')
+    def level_exists(self, level):
+        '''
+        Проверяет, встречались ли элементы на данном уровне.
+        '''
 
+        return level in self._levels
 
-def close_elements(indent):
-    '''
-    Закрывает все последние элементы XML с данным отступом.
-    '''
+    def paste_list_entry(self, value):
+        '''
+        Вставляет в выходной файл элемент списка.
+        '''
+
+        if value[0] == '[' and value[-1] == ']':
+            values = map(str.strip, value[1:-1].split(','))
+            for v in map(self.parse_string, values):
+                self._out.element('value', v)
+        else:
+            self._out.text(self.parse_string(value))
 
-    global indents, opened, out_file
+    def paste_element(self, key, value):
+        '''
+        Вставляет в выходной файл элемент XML, полученный из элемента словаря YAML.
+        '''
 
-    while len(opened) > 0 and opened[-1][1] == indent:
-        out_file.write('    ' * len(opened) + f'</{opened[-1][0]}>\n')
-        opened.pop()
+        if value[0] == '[' and value[-1] == ']':
+            if len(value[1:-1].strip()) == 0:
+                self._out.element(key)
+            else:
+                values = list(map(str.strip, value[1:-1].split(',')))
 
+                self._out.start(key)
+                for v in map(self.parse_string, values):
+                    self._out.element('value', v)
+                self._out.end()
+        else:
+            self._out.element(key, self.parse_string(value))
 
-def is_line_skippable(line):
-    line = line.rstrip()
+    def open_element(self, elem, level):
+        '''
+        Открывает элемент XML, который будет закрыт при нахождении другого элемента
+        с данным отступом или при достижении конца файла.
+        '''
 
-    return line == '---' or line == '...' or line == ''
+        self._opened.append((elem, level))
+        self._out.start(elem)
+
+    def close_elements(self, level):
+        '''
+        Закрывает все последние элементы XML на данном уровне.
+        '''
+
+        while len(self._opened) > 0 and self._opened[-1][1] == level:
+            self._out.end()
+            self._opened.pop()
+
+    def close_level(self):
+        '''
+        Закрывает последний уровень вложенности и все его элементы XML.
+        '''
+
+        level = self._indents.pop()
+        self._levels.remove(level)
+        self.close_elements(level)
+
+    def convert(self, in_file):
+        '''
+        Преобразует YAML из текстового потока in_file в XML.
 
+        Файл читается построчно, а XML записывается по мере разбора, поэтому
+        расход памяти определяется глубиной вложенности, а не размером файла.
+        '''
+
+        if self._instr is None:
+            self._convert(in_file, self.tokenize)
+            return
 
-indents = []
-opened = []
+        with self._instr.phase('convert'):
+            nb_lines = self._convert(in_file, self._instr.timed('tokenize', self.tokenize))
 
-out_file = None
+        self._instr.count('lines', nb_lines)
 
+    def _convert(self, in_file, tokenize):
+        '''
+        Выполняет преобразование и возвращает число прочитанных строк.
+        '''
 
-def main():
-    global indents, opened, out_file
+        self._indents = []
+        self._levels = set()
+        self._opened = []
 
-    with open('input/timetable.yaml', 'r') as in_file, \
-        open('output/task0.xml', 'w') as out_file:
-        out_file.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        out_file.write('<root>\n')
+        self._out.declaration()
+        self._out.start('root')
 
-        for i, line in enumerate(in_file.readlines()):
-            if is_line_skippable(line):
+        i = -1
+        for i, line in enumerate(in_file):
+            line = tokenize(line)
+            if line is None:
                 continue
 
-            indent = get_indent(line)
-            
+            level = (line.indent, line.is_list)
+
             '''
             Проверяет, существует ли уровень, на котором может быть размещен
             элемент XML с данным оступом.
             '''
-            if not indent_exists(indent) and \
-                    len(indents) != 0 and get_nb_spaces(indent) < get_nb_spaces(indents[-1]):
-                print(f'Wrong indentation at line {i + 1}.')
-                exit(1)
+            if not self.level_exists(level) and len(self._indents) != 0 and \
+                    level[0] < self._indents[-1][0]:
+                raise ValueError(f'Wrong indentation at line {i + 1}.')
 
             '''
-            Закрывает предыдущий элемент XML с данным отступом и
-            все вложенные в него элементы. 
+            Закрывает предыдущий элемент XML на данном уровне и
+            все вложенные в него элементы. Уровни в стеке не повторяются,
+            поэтому каждый уровень закрывается один раз.
             '''
-            while indent_exists(indent):
-                close_elements(indents[-1])
-                indents.pop()
+            if self.level_exists(level):
+                while self._indents[-1] != level:
+                    self.close_level()
+                self.close_level()
 
             '''
             Открывет элемент XML.
             '''
-            indents.append(indent)
+            self._indents.append(level)
+            self._levels.add(level)
 
-            if is_list_entry(indent):
-                open_element('value', indent)
+            if level[1]:
+                self.open_element('value', level)
 
-            if is_dict_entry(line):
-                key, value = map(str.strip, line[len(indent):].split(':', 1))
-            
-                if value == '':
-                    open_element(key, indent)
+            if line.kind == DICT_ENTRY:
+                if line.value == '':
+                    self.open_element(line.key, level)
                 else:
-                    paste_element(key, value)
+                    self.paste_element(line.key, line.value)
             else:
-                paste_list_entry(line)
+                self.paste_list_entry(line.value)
 
         '''
         Закрывает все оставшиеся элементы XML.
         '''
-        while len(indents) != 0:
-            close_elements(indents[-1])
-            indents.pop()
+        while len(self._indents) != 0:
+            self.close_level()
+
+        self._out.end()
+        self._out.flush()
+
+        return i + 1
+
+
+def convert(in_file, out_file, pretty=True, instr=None):
+    '''
+    Преобразует YAML из текстового потока in_file в XML и записывает его
+    в out_file (с отступами, если задан pretty). Каждый вызов использует
+    собственный преобразователь. instr — необязательный
+    instrument.Instrument для сбора статистики.
+    '''
 
-        out_file.write('</root>\n')
+    Converter(out_file, pretty, instr).convert(in_file)
 
-    indents = []
-    opened = []
 
-    out_file = None
+def main(in_path='input/timetable.yaml', out_path='output/task0.xml'):
+    with open(in_path, 'r') as in_file, open(out_path, 'w') as out_file:
+        try:
+            convert(in_file, out_file)
+        except ValueError as e:
+            print(e)
+            exit(1)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
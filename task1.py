@@ -1,47 +1,352 @@
-import xml.etree.ElementTree as xml
-import yaml
-try:
-    from yaml import CLoader as Loader
-except ImportError:
-    print('Import error')
-    from yaml import Loader
+from writer import XmlEmitter
 
 
-def create_xml_element(k, v):
-    element = xml.Element(k)
+def _loader():
+    '''
+    Возвращает класс загрузчика PyYAML: CLoader на libyaml, если PyYAML
+    собран с ней, иначе Loader на чистом Python. PyYAML импортируется при
+    первом вызове, а не при импорте модуля.
+    '''
+
+    import yaml
+
+    if getattr(yaml, '__with_libyaml__', False):
+        return yaml.CLoader
+
+    return yaml.Loader
+
+
+def backend():
+    '''
+    Возвращает 'libyaml', если разбор идёт через C-расширение PyYAML,
+    иначе 'python'.
+    '''
+
+    return 'libyaml' if _loader().__module__ == 'yaml.cyaml' else 'python'
+
+
+def load_yaml(text):
+    '''
+    Разбирает YAML (текст или поток) средствами PyYAML, по возможности быстрым загрузчиком
+    CLoader на libyaml.
+    '''
+
+    import yaml
+
+    return yaml.load(text, Loader=_loader())
+
+
+def write_xml_element(k, v, out):
     if type(v) is list or type(v) is dict:
-        element.extend(create_xml_elements(v))
+        if len(v) == 0:
+            out.element(k)
+        else:
+            out.start(k)
+            write_xml_elements(v, out)
+            out.end()
     else:
-        element.text = str(v)
-
-    return element
+        out.element(k, str(v))
 
 
-def create_xml_elements(data):
+def write_xml_elements(data, out):
     if type(data) is list:
-        return [create_xml_element('value', v) for v in data]
+        for v in data:
+            write_xml_element('value', v, out)
     elif type(data) is dict:
-        return [create_xml_element(k, v) for k, v in data.items()]
+        for k, v in data.items():
+            write_xml_element(k, v, out)
     else:
-        print('Unknown type of data')
-        exit(1)
+        raise ValueError('Unknown type of data')
+
+
+def dump_xml(data, f, pretty=True, instr=None):
+    '''
+    Записывает data в поток f как XML. instr — необязательный
+    instrument.Instrument, в котором запись учитывается как фаза serialize.
+    '''
+
+    with XmlEmitter(f, pretty, instr=instr) as out:
+        out.declaration()
+
+        if instr is None:
+            write_xml_element('root', data, out)
+        else:
+            with instr.phase('serialize'):
+                write_xml_element('root', data, out)
+
+
+class MergeKeyError(ValueError):
+    '''
+    Ключ слияния '<<', который EventWriter не может записать потоково.
+    '''
+
+
+class EventWriter:
+    '''
+    Запись XML по событиям PyYAML (yaml.parse) без построения словарей и
+    списков: элементы открываются и закрываются по мере чтения событий,
+    поэтому память не зависит от размера документа. Результат совпадает
+    с dump_xml(load_yaml(text)).
+
+    Простые скаляры приводятся к типам так же, как при загрузке: тег
+    определяет резольвер загрузчика, значение строит его конструктор, а в
+    XML записывается str() значения. События узла с якорем запоминаются
+    и воспроизводятся для каждого псевдонима.
+
+    Ключи слияния '<<' требуют всего словаря до начала записи, поэтому
+    на них выбрасывается MergeKeyError; повторяющиеся ключи записываются
+    все, а не только последний.
+    '''
+
+    '''
+    Наибольшее число запомненных текстов простых скаляров.
+    '''
+    MAX_CACHED_SCALARS = 1 << 14
+
+    def __init__(self, out, loader):
+        from yaml.events import (AliasEvent, MappingEndEvent, MappingStartEvent,
+            ScalarEvent, SequenceEndEvent, SequenceStartEvent, StreamEndEvent)
+        from yaml.nodes import ScalarNode
+
+        self._out = out
+        self._loader = loader('')
+        self._scalar_node = ScalarNode
+        self._scalars = {}
+        self._anchors = {}
+        self._recordings = []
+        self._next_event = None
+
+        self._scalar_event = ScalarEvent
+        self._alias_event = AliasEvent
+        self._mapping_end = MappingEndEvent
+        self._sequence_end = SequenceEndEvent
+        self._stream_end = StreamEndEvent
+        self._writers = {
+            ScalarEvent: self._write_scalar,
+            AliasEvent: self._write_alias,
+            SequenceStartEvent: self._write_sequence,
+            MappingStartEvent: self._write_mapping,
+        }
+
+    def write(self, events):
+        '''
+        Записывает элемент root с единственным документом потока events.
+        '''
+
+        read = iter(events).__next__
+        recordings = self._recordings
+
+        def next_event():
+            event = read()
+            for recording in recordings:
+                recording.append(event)
+
+            return event
+
+        self._next_event = next_event
+
+        next_event()
+        event = next_event()
+
+        if type(event) is self._stream_end:
+            self._out.element('root', 'None')
+            return
+
+        self._write_node('root', next_event(), next_event)
+        next_event()
+
+        if type(next_event()) is not self._stream_end:
+            raise ValueError('Expected a single document in the stream')
+
+    def _write_node(self, tag, event, next_event):
+        self._writers[type(event)](tag, event, next_event)
+
+    def _construct(self, tag, value):
+        return str(self._loader.construct_document(self._scalar_node(tag, value)))
+
+    def _scalar(self, event, next_event):
+        '''
+        Возвращает текст скаляра. Тексты простых скаляров кэшируются,
+        поскольку значения в расписаниях часто повторяются.
+        '''
 
+        if event.anchor is not None and next_event is self._next_event:
+            self._anchors[event.anchor] = [event]
 
-def dump_xml(data):
-    root = create_xml_element('root', data)
+        tag = event.tag
+        value = event.value
 
-    tree = xml.ElementTree(root)
-    xml.indent(tree, space='    ', level=0)
+        if tag is not None and tag != '!':
+            return self._construct(tag, value)
+        if not event.implicit[0]:
+            return value
 
-    return tree
+        text = self._scalars.get(value)
+        if text is None:
+            tag = self._loader.resolve(self._scalar_node, value, (True, False))
+            if tag == 'tag:yaml.org,2002:merge':
+                raise MergeKeyError('Merge keys are not supported by the event stream')
+
+            text = self._construct(tag, value)
+
+            if len(self._scalars) >= self.MAX_CACHED_SCALARS:
+                self._scalars.clear()
+            self._scalars[value] = text
+
+        return text
+
+    def _key(self, event, next_event):
+        if type(event) is self._alias_event:
+            event = self._recorded(event)[0]
+            next_event = None
+
+        if type(event) is not self._scalar_event:
+            raise ValueError('A dictionary key must be a scalar')
+
+        return self._scalar(event, next_event)
+
+    def _recorded(self, event):
+        recorded = self._anchors.get(event.anchor)
+        if recorded is None:
+            raise ValueError(f'Found undefined alias {event.anchor}')
+
+        return recorded
+
+    def _write_scalar(self, tag, event, next_event):
+        self._out.element(tag, self._scalar(event, next_event))
+
+    def _write_alias(self, tag, event, next_event):
+        recorded = self._recorded(event)
+        self._write_node(tag, recorded[0], iter(recorded[1:]).__next__)
+
+    def _start_recording(self, event, next_event):
+        if event.anchor is None or next_event is not self._next_event:
+            return None
+
+        recording = [event]
+        self._recordings.append(recording)
+
+        return recording
+
+    def _stop_recording(self, event, recording):
+        if recording is not None:
+            self._recordings.pop()
+            self._anchors[event.anchor] = recording
+
+    def _write_sequence(self, tag, event, next_event):
+        recording = self._start_recording(event, next_event)
+        out = self._out
+        end = self._sequence_end
+
+        item = next_event()
+        if type(item) is end:
+            out.element(tag)
+        else:
+            out.start(tag)
+            while type(item) is not end:
+                self._write_node('value', item, next_event)
+                item = next_event()
+            out.end()
+
+        self._stop_recording(event, recording)
+
+    def _write_mapping(self, tag, event, next_event):
+        recording = self._start_recording(event, next_event)
+        out = self._out
+        end = self._mapping_end
+
+        key = next_event()
+        if type(key) is end:
+            out.element(tag)
+        else:
+            out.start(tag)
+            while type(key) is not end:
+                self._write_node(self._key(key, next_event), next_event(), next_event)
+                key = next_event()
+            out.end()
+
+        self._stop_recording(event, recording)
+
+
+def convert_events(source, out_file, pretty=True, instr=None):
+    '''
+    Записывает YAML из source (текста или потока) в out_file как XML по
+    событиям PyYAML, через CParser на libyaml, если он доступен. instr —
+    необязательный instrument.Instrument, в котором преобразование
+    учитывается как фаза convert.
+    '''
+
+    import yaml
+
+    loader = _loader()
+
+    with XmlEmitter(out_file, pretty, instr=instr) as out:
+        out.declaration()
+
+        if instr is None:
+            EventWriter(out, loader).write(yaml.parse(source, Loader=loader))
+        else:
+            with instr.phase('convert'):
+                EventWriter(out, loader).write(yaml.parse(source, Loader=loader))
+
+
+def convert(in_file, out_file, pretty=True, instr=None):
+    '''
+    Записывает YAML из потока in_file в out_file как XML через
+    convert_events, не читая вход целиком. Если в документе встретился
+    ключ слияния '<<', вход перечитывается с начала через load_yaml, а
+    уже записанная часть вывода отбрасывается. Если in_file не
+    поддерживает seek (канал, стандартный ввод), MergeKeyError
+    передаётся вызывающему. Вывод без seek (например, стандартный) сначала
+    пишется во временный файл.
+    '''
+
+    if not out_file.seekable():
+        import shutil
+        import tempfile
+
+        with tempfile.TemporaryFile('w+', encoding='utf-8') as tmp_file:
+            convert(in_file, tmp_file, pretty, instr)
+
+            tmp_file.seek(0)
+            shutil.copyfileobj(tmp_file, out_file)
+
+        return
+
+    if not in_file.seekable():
+        convert_events(in_file, out_file, pretty, instr)
+        return
+
+    in_start = in_file.tell()
+    out_start = out_file.tell()
+
+    try:
+        convert_events(in_file, out_file, pretty, instr)
+        return
+    except MergeKeyError:
+        pass
+
+    in_file.seek(in_start)
+    out_file.seek(out_start)
+    out_file.truncate()
+
+    if instr is None:
+        data = load_yaml(in_file)
+    else:
+        with instr.phase('parse'):
+            data = load_yaml(in_file)
 
+    dump_xml(data, out_file, pretty, instr)
 
-def main():
-    with open('input/timetable.yaml', 'r') as in_file:
-        data = yaml.load(in_file.read(), Loader=Loader)
 
-        dump_xml(data).write('output/task1.xml', encoding='UTF-8', xml_declaration=True)
+def main(in_path='input/timetable.yaml', out_path='output/task1.xml'):
+    with open(in_path, 'r') as in_file, open(out_path, 'w') as out_file:
+        try:
+            convert(in_file, out_file)
+        except ValueError as e:
+            print(e)
+            exit(1)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -34,26 +34,559 @@ list-entry(n) ::= '-' (
 )
 list(n) ::= list-entry(n) (newline indent(n) list-entry(n))*
 
+properties(n) ::= '&' anchor space* (space literal(n) | newline block(n)) |
+    '*' anchor
+
 document ::= ('---' newline )? indent(m) (list(m) | dict(m)) (newline '...')?
 file ::= document+
 '''
 
 
+import io
+import mmap
+import itertools
+import os
 import re
+from collections.abc import Mapping, Sequence
+
+from compact import CompactBuilder
+from writer import XmlEmitter
+
+
+DICT_KEY = 'dict-key'
+DICT_ENTRY = 'dict-entry'
+LIST_EMPTY = 'list-empty'
+LIST_ENTRY = 'list-entry'
+SCALAR = 'scalar'
+
+
+'''
+Header of a block scalar: a style indicator, '|' (literal) or '>'
+(folded), followed by an optional chomping indicator and an optional
+indentation indicator in any order.
+'''
+_BLOCK_HEADER = re.compile(r'([|>])(?:([+-])([1-9])?|([1-9])([+-])?)?$')
+
+
+'''
+Key of a merge entry ('<<: *anchor'). It is returned by
+YamlParser._parse_dict_entry instead of the key '<<', so that a quoted
+'<<' stays an ordinary key.
+'''
+_MERGE_KEY = object()
+
+
+'''
+Number of distinct lines whose tokens FileBuffer keeps. Lines of a YAML
+file repeat a lot (the same keys with the same values at the same
+indent), and a Token depends only on the text of the line, so a repeated
+line reuses the Token lexed for the first one.
+'''
+_TOKEN_CACHE_SIZE = 4096
+
+
+def _is_string_part(s):
+    return ': ' not in s and s[-1:] != ':' and not s.startswith('- ')
+
+
+class Token:
+    '''
+    Classification of a line (or of its part after an offset) computed once
+    by the lexer. kind is one of DICT_KEY ('key:'), DICT_ENTRY ('key: value'),
+    LIST_EMPTY ('-'), LIST_ENTRY ('- value') and SCALAR. For DICT_ENTRY and
+    LIST_ENTRY prefix is the length of the text before the value, and
+    value is the text after it; for DICT_ENTRY is_scalar tells whether the
+    value is a plain or quoted scalar rather than a collection, a block
+    scalar, an anchor or an alias.
+
+    Only kind, key, prefix, value and is_scalar are computed up front:
+    they are all that a 'key: value' line, the most frequent one, needs.
+    text, is_dash, flow and is_string_part are computed from the line when
+    they are read.
+    '''
+
+    __slots__ = ('kind', 'key', 'prefix', 'value', 'is_scalar', '_s', '_rest')
+
+    def __init__(self, s):
+        rest = s.lstrip(' ')
+        c = rest[:1]
+
+        self._s = s
+        self._rest = rest
+        self.key = None
+        self.prefix = 0
+        self.value = None
+        self.is_scalar = False
+
+        if c == '-':
+            if len(rest) == 1:
+                self.kind = LIST_EMPTY
+            elif rest[1] == ' ':
+                self.kind = LIST_ENTRY
+                self.value = value = rest[1:].lstrip(' ')
+                self.prefix = len(s) - len(value)
+            else:
+                self.kind = SCALAR
+
+            return
+
+        if c != '' and c != '[' and c != '{' and not c.isspace():
+            if rest[-1] == ':' and len(rest) >= 2:
+                self.kind = DICT_KEY
+                self.key = rest[:-1]
+                return
+
+            sep = rest.find(': ', 1)
+            if sep != -1:
+                self.kind = DICT_ENTRY
+                self.key = rest[:sep]
+                self.value = value = rest[sep + 1:].lstrip(' ')
+                self.prefix = len(s) - len(value)
+                self.is_scalar = value[0] not in '[{|>&*' and _is_string_part(value)
+                return
+
+        self.kind = SCALAR
+
+    @property
+    def text(self):
+        return self._rest.strip()
+
+    @property
+    def is_dash(self):
+        return self._rest.strip()[:1] == '-'
+
+    @property
+    def flow(self):
+        c = self._rest[:1]
+
+        return c if c == '[' or c == '{' else None
+
+    @property
+    def is_string_part(self):
+        if self.kind == DICT_KEY or self.kind == DICT_ENTRY:
+            return False
+
+        return _is_string_part(self._s)
+
+
+_ESCAPES = {
+    '0': '\0', 'a': '\a', 'b': '\b', 't': '\t', '\t': '\t', 'n': '\n', 'v': '\v',
+    'f': '\f', 'r': '\r', 'e': '\x1b', ' ': ' ', '"': '"', '/': '/', '\\': '\\',
+    'N': '\x85', '_': '\xa0', 'L': '\u2028', 'P': '\u2029',
+}
+_ESCAPE = re.compile(r'\\(x[0-9A-Fa-f]{2}|u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)', re.DOTALL)
+
+
+def _unescape(s, error):
+    '''
+    Replaces the escape sequences of a double-quoted string. error is
+    called with a message for an unknown escape sequence.
+    '''
+
+    def replace(m):
+        e = m.group(1)
+        if len(e) > 1:
+            return chr(int(e[1:], 16))
+        if e not in _ESCAPES:
+            error(f'Unknown escape sequence \'\\{e}\'')
+
+        return _ESCAPES[e]
+
+    return _ESCAPE.sub(replace, s)
+
+
+class _FlowScanner:
+    '''
+    Scanner of a flow collection ('[...]' or '{...}') that reads it in one
+    pass, character by character, so nested collections, quoted strings
+    with ',', ':' or '#' and escape sequences are parsed in time linear in
+    the length of the collection. The text is read line by line: when the
+    collection continues on the next line, next_line() returns that raw
+    line, and the line break is folded into a space as in YAML.
+
+    anchor registers the node of '&name', alias resolves '*name' and
+    error reports an error; all three are provided by the parser.
+    '''
+
+    def __init__(self, line, next_line, anchor, alias, error):
+        self._s = line
+        self._i = 0
+        self._next_line = next_line
+        self._anchor = anchor
+        self._alias = alias
+        self._error = error
+
+
+    def at_end(self):
+        '''
+        Checks that only spaces and a comment follow the scanned node.
+        '''
+
+        rest = self._s[self._i:].lstrip(' \t')
+
+        return rest == '' or rest[0] == '#'
+
+
+    def _fold(self):
+        '''
+        Moves to the next non-empty line and returns what the line break
+        folds into: a space, or a newline for every empty line skipped.
+        '''
+
+        empty = 0
+
+        self._s = self._next_line()
+        while self._s.strip(' \t') == '':
+            empty += 1
+            self._s = self._next_line()
+
+        self._i = len(self._s) - len(self._s.lstrip(' \t'))
+
+        return '\n' * empty if empty != 0 else ' '
+
+
+    def _skip_space(self):
+        '''
+        Skips spaces, comments and line breaks, so that the current
+        character is the next meaningful one.
+        '''
+
+        while True:
+            s = self._s
+            i = self._i
+            n = len(s)
+
+            while i < n and (s[i] == ' ' or s[i] == '\t'):
+                i += 1
+
+            if i < n and s[i] != '#':
+                self._i = i
+                return
+
+            self._s = self._next_line()
+            self._i = 0
+
+
+    def node(self):
+        self._skip_space()
+        c = self._s[self._i]
+
+        if c == '[':
+            return self._sequence()
+        if c == '{':
+            return self._mapping()
+        if c == '"':
+            return self._double_quoted()
+        if c == '\'':
+            return self._single_quoted()
+        if c == ',' or c == ']' or c == '}':
+            self._error('A flow collection entry must not be empty')
+        if c == '*':
+            return self._alias(self._plain())
+        if c == '&':
+            return self._anchored()
+
+        return self._plain()
+
+
+    def _anchored(self):
+        '''
+        Parses an anchored node ('&name value'); an anchor followed by the
+        end of the entry anchors None.
+        '''
+
+        s = self._s
+        start = self._i + 1
+        i = start
+        while i < len(s) and s[i] not in ' \t,[]{}':
+            i += 1
+
+        name = s[start:i]
+        if name == '':
+            self._error('Invalid anchor name')
+
+        self._i = i
+        self._skip_space()
+
+        c = self._s[self._i]
+        if c == '&':
+            self._error('A node must not have more than one anchor')
+
+        v = None if c == ',' or c == ']' or c == '}' else self.node()
+
+        return self._anchor(name, v)
+
+
+    def _value(self, end):
+        self._skip_space()
+
+        c = self._s[self._i]
+        if c == ',' or c == end:
+            return None
+
+        return self.node()
+
+
+    def _key(self, key):
+        if not isinstance(key, str):
+            self._error('A dictionary key must be a string')
+
+        return key
+
+
+    def _sequence(self):
+        self._i += 1
+        items = []
+
+        while True:
+            self._skip_space()
+            if self._s[self._i] == ']':
+                self._i += 1
+                return items
+
+            item = self.node()
+
+            self._skip_space()
+            if self._s[self._i] == ':':
+                self._i += 1
+                item = {self._key(item): self._value(']')}
+                self._skip_space()
+
+            items.append(item)
+
+            c = self._s[self._i]
+            self._i += 1
+            if c == ']':
+                return items
+            if c != ',':
+                self._error('Expected \',\' or \']\' in a list')
+
+
+    def _mapping(self):
+        self._i += 1
+        entries = {}
+
+        while True:
+            self._skip_space()
+            if self._s[self._i] == '}':
+                self._i += 1
+                return entries
+
+            key = self._key(self.node())
+
+            value = None
+            self._skip_space()
+            if self._s[self._i] == ':':
+                self._i += 1
+                value = self._value('}')
+                self._skip_space()
+
+            if key in entries:
+                self._error('All keys in a dictionary must have different names')
+            entries[key] = value
+
+            c = self._s[self._i]
+            self._i += 1
+            if c == '}':
+                return entries
+            if c != ',':
+                self._error('Expected \',\' or \'}\' in a dictionary')
+
+
+    def _plain(self):
+        '''
+        Scans a plain scalar up to a flow indicator, a ': ' or a comment;
+        it may continue on the following lines unless a comment ends it.
+        '''
+
+        parts = []
+
+        while True:
+            s = self._s
+            i = start = self._i
+            n = len(s)
+
+            while i < n:
+                c = s[i]
+                if c == ',' or c == '[' or c == ']' or c == '{' or c == '}':
+                    break
+                if c == ':' and (i + 1 == n or s[i + 1] in ' \t,[]{}'):
+                    break
+                if c == '#' and s[i - 1] in ' \t':
+                    break
+                i += 1
+
+            self._i = i
+            parts.append(s[start:i].strip(' \t'))
+
+            if i < n:
+                break
+
+            self._skip_space()
+            s = self._s
+            i = self._i
+            if s[i] in ',[]{}' or s[i] == ':' and (i + 1 == len(s) or s[i + 1] in ' \t,[]{}'):
+                break
+
+        return ' '.join(parts)
+
+
+    def _single_quoted(self):
+        self._i += 1
+        parts = []
+
+        while True:
+            s = self._s
+            i = self._i
+            j = s.find('\'', i)
+
+            if j == -1:
+                parts.append(s[i:].rstrip(' \t'))
+                parts.append(self._fold())
+                continue
+
+            parts.append(s[i:j])
+            if s[j + 1:j + 2] == '\'':
+                parts.append('\'')
+                self._i = j + 2
+                continue
+
+            self._i = j + 1
+
+            return ''.join(parts)
+
+
+    def _double_quoted(self):
+        self._i += 1
+        parts = []
+
+        while True:
+            s = self._s
+            i = start = self._i
+            n = len(s)
+
+            while i < n and s[i] != '"':
+                i += 2 if s[i] == '\\' else 1
+
+            if i < n:
+                parts.append(s[start:i])
+                self._i = i + 1
+
+                return _unescape(''.join(parts), self._error)
+
+            if i > n:
+                parts.append(s[start:n - 1])
+                sep = self._fold()
+                parts.append('' if sep == ' ' else sep)
+            else:
+                parts.append(s[start:n].rstrip(' \t'))
+                parts.append(self._fold())
+
+
+def _iter_buffer_blocks(buf, block_size=1 << 20):
+    '''
+    Yields the lines of a UTF-8 encoded buffer (bytes or mmap) in lists,
+    one list per block of about block_size bytes that ends at a line
+    boundary. Each block is decoded at once straight from a memoryview, so
+    the buffer is copied block by block rather than line by line.
+    '''
+
+    view = memoryview(buf)
+    start = 0
+    end = len(buf)
+
+    try:
+        while start < end:
+            stop = start + block_size
+            if stop >= end:
+                stop = end
+            else:
+                stop = buf.find(b'\n', stop)
+                stop = end if stop == -1 else stop + 1
+
+            block = str(view[start:stop], 'utf-8')
+            lines = block.split('\n')
+            if block.endswith('\n'):
+                lines.pop()
+
+            yield lines
+            start = stop
+    finally:
+        view.release()
 
 
 class FileBuffer:
-    def __init__(self, filepath):
-        self._file = open(filepath)
+    def __init__(self, source, use_mmap=False, line_offset=0, instr=None):
+        '''
+        source is a path to a YAML file, its contents as bytes, or an already
+        opened text or binary stream (any iterable of lines). A str is always
+        a path: YAML text is passed as io.StringIO(text) or encoded to bytes,
+        and a str with a line break raises ValueError. If use_mmap is set,
+        a file given by path is memory-mapped instead of being read through
+        a text stream. Only files opened here are closed.
+
+        line_offset is added to line numbers, for sources that are a part
+        of a larger file. If instr (an instrument.Instrument) is given,
+        reading lines is timed as the 'read' phase and counted as 'lines'.
+        '''
+
+        self._file = None
+        self._mmap = None
+        self._blocks = None
+        self._lines = None
+
+        if isinstance(source, str) and '\n' in source:
+            raise ValueError('source is a path, not YAML text; '
+                'pass the text as io.StringIO or bytes')
+
+        if isinstance(source, (str, os.PathLike)):
+            if use_mmap:
+                self._file = open(source, 'rb')
+                if os.fstat(self._file.fileno()).st_size != 0:
+                    self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                    self._read_blocks(self._mmap)
+                else:
+                    self._lines = iter(())
+            else:
+                self._file = open(source)
+                self._lines = self._file
+        elif isinstance(source, (bytes, bytearray, memoryview)):
+            self._read_blocks(bytes(source) if isinstance(source, memoryview) else source)
+        elif isinstance(source, (io.RawIOBase, io.BufferedIOBase)):
+            self._lines = (line.decode('utf-8') for line in source)
+        else:
+            self._lines = iter(source)
+
         self._curr_line = None
+        self._raw_line = None
+        self._indent = 0
+        self._eod = True
+        self._token = None
         self._offset = 0
-        self._index = 0
+        self._index = line_offset
+        self._tokens = {}
+        self.nb_tokens = 0
+
+        if instr is not None:
+            read = instr.timed('read', self.next)
+
+            def next():
+                read()
+                if self._curr_line is not None:
+                    instr.count('lines')
+
+            self.next = next
 
         self.next()
 
     
+    def _read_blocks(self, buf):
+        self._blocks = _iter_buffer_blocks(buf)
+        self._lines = itertools.chain.from_iterable(self._blocks)
+
+
     def closed(self):
-        return self._file is None or self._file.closed
+        return self._lines is None
 
 
     def line_index(self):
@@ -64,35 +597,100 @@ class FileBuffer:
         if self._curr_line is None:
             return None
 
-        return self._curr_line[self._offset:].rstrip()
+        return self._curr_line[self._offset:]
 
 
     def full_line(self):
-        if self._curr_line is None:
+        return self._curr_line
+
+
+    def raw_line(self):
+        '''
+        Returns the current line as it is in the file, with comments and
+        trailing spaces, for block scalars and flow collections. The line
+        break is removed here rather than in next(), since most lines are
+        never read raw.
+        '''
+
+        if self._raw_line is None:
             return None
 
-        return self._curr_line.rstrip()
+        return self._raw_line.rstrip('\r\n')
+
+
+    def indent(self):
+        return self._indent
+
+
+    def eod(self):
+        '''
+        Checks whether the current line ends a document: it is '---', '...'
+        or the end of the file.
+        '''
+
+        return self._eod
+
+
+    def token(self):
+        if self._token is None:
+            line = self.line()
+            token = self._tokens.get(line)
+
+            if token is None:
+                if len(self._tokens) >= _TOKEN_CACHE_SIZE:
+                    self._tokens.clear()
+
+                token = self._tokens[line] = Token(line)
+                self.nb_tokens += 1
+
+            self._token = token
+
+        return self._token
 
 
     def next(self):
         try:
-            self._curr_line = \
-                re.fullmatch(r'(.*?)(?:#.*)?', next(self._file).rstrip())[1]
-
-            self._index += 1
-            self._offset = 0
-        except:
-            self._file.close()
-            self._file = None
+            line = next(self._lines)
+        except StopIteration:
+            self.close()
 
             self._curr_line = None
+            self._raw_line = None
+            self._eod = True
+            self._token = None
 
-            self._index = -1
             self._offset = -1
 
+            return
+
+        self._raw_line = line
+
+        comment = line.find('#')
+        if comment != -1:
+            line = line[:comment]
+        line = line.rstrip()
+
+        self._curr_line = line
+        self._indent = len(line) - len(line.lstrip())
+        self._eod = line == '---' or line == '...'
+        self._token = None
+
+        self._index += 1
+        self._offset = 0
+
         
     def skip(self):
-        while self.full_line() is not None and len(self.full_line().strip()) == 0:
+        while self._curr_line == '':
+            self.next()
+
+
+    def advance(self):
+        '''
+        Moves to the next non-empty line.
+        '''
+
+        self.next()
+        while self._curr_line == '':
             self.next()
 
 
@@ -102,11 +700,30 @@ class FileBuffer:
 
     def add_offset(self, n):
         self._offset += n
+        self._token = None
 
 
-    def __del__(self):
+    def close(self):
+        if self._blocks is not None:
+            self._blocks.close()
+            self._blocks = None
+        self._lines = None
+
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
         if self._file is not None:
             self._file.close()
+            self._file = None
+
+
+    def __del__(self):
+        self.close()
+
+class YamlError(ValueError):
+    pass
+
 
 class YamlParser:
     GREATER_INDENT = 1
@@ -114,43 +731,111 @@ class YamlParser:
     EQUAL_INDENT = 0
 
 
-    def __init__(self):
+    def __init__(self, compact=False, instr=None):
+        '''
+        If compact is set, documents are built from the slotted nodes of
+        the compact module instead of dicts and lists.
+
+        instr is an optional instrument.Instrument. With it, parsing each
+        document is timed as the 'parse' phase, scalar line joining as
+        'scalar' and the _is_*_start predicates as 'predicates', and
+        documents, lines and tokens are counted. Without it the parser
+        runs unchanged.
+        '''
+
         self._buf = None
+        self._anchors = {}
+        self._builder = CompactBuilder() if compact else None
+        self._instr = instr
 
-    
-    def parse(self, filepath):
-        self._buf = FileBuffer(filepath)
+        if instr is not None:
+            self._parse_doc = instr.timed('parse', self._parse_doc)
+            self._parse_scalar = instr.timed('scalar', self._parse_scalar)
 
-        self._buf.skip()
-        docs = []
+            for name in ('_is_dict_start', '_is_list_start', '_is_literal_start'):
+                setattr(self, name, instr.timed('predicates', getattr(self, name)))
 
-        while not self._buf.closed():
-            docs.append(self._parse_doc())
 
-        del self._buf
-        self._buf = None
+    def parse(self, source, use_mmap=False, line_offset=0):
+        return list(self.iter_documents(source, use_mmap, line_offset))
 
-        return docs
 
-    
-    def _handle_error(self, s):
-        print(f'Error at line {self._buf.line_index()}: {s}')
-        exit(1)
+    def iter_documents(self, source, use_mmap=False, line_offset=0):
+        '''
+        Yields the documents of a YAML file or text stream one by one, as
+        soon as each of them is parsed. Only the current document is kept
+        in memory, so a parser must not be shared between simultaneous
+        iterations.
+        '''
+
+        self._buf = buf = FileBuffer(source, use_mmap, line_offset, self._instr)
+
+        try:
+            buf.skip()
+
+            while not buf.closed():
+                yield self._parse_doc()
+
+                if self._instr is not None:
+                    self._instr.count('documents')
+        finally:
+            if self._instr is not None:
+                self._instr.count('tokens', buf.nb_tokens)
+
+            buf.close()
+            self._buf = None
+
+
+    def iter_items(self, source, use_mmap=False, line_offset=0):
+        '''
+        Like iter_documents, but a document whose root is a list is not
+        built whole: its entries are yielded one by one as soon as each of
+        them is parsed, so only the current entry is kept in memory. Other
+        documents are yielded whole. Useful for files made of one large
+        list, such as a timetable of days.
+        '''
+
+        self._buf = buf = FileBuffer(source, use_mmap, line_offset, self._instr)
+
+        try:
+            buf.skip()
+
+            while not buf.closed():
+                self._begin_doc()
+
+                if not buf.eod() and self._is_list_start():
+                    for entry in self._iter_list(self._buf.indent()):
+                        yield self._builder.value(entry) if self._builder is not None else entry
+                else:
+                    yield self._parse_doc_content()
+
+                self._end_doc()
 
+                if self._instr is not None:
+                    self._instr.count('documents')
+        finally:
+            if self._instr is not None:
+                self._instr.count('tokens', buf.nb_tokens)
 
-    def _indent_len(self):
-        return len(self._buf.full_line()) - len(self._buf.full_line().lstrip())
+            buf.close()
+            self._buf = None
+
+
+    def _handle_error(self, s):
+        raise YamlError(f'Error at line {self._buf.line_index()}: {s}')
 
 
     def _cmp_indent_len_to(self, n):
-        if self._indent_len() > n:
+        indent_len = self._buf.indent()
+
+        if indent_len > n:
             return self.GREATER_INDENT
-        elif self._indent_len() < n:
+        elif indent_len < n:
             return self.LESS_INDENT
         else:
             return self.EQUAL_INDENT
 
-    
+
     def _is_doc_start(self):
         return self._buf.full_line() == '---'
 
@@ -159,40 +844,63 @@ class YamlParser:
         return self._buf.full_line() == '...'
 
 
-    def _is_eod(self):
-        return self._buf.full_line() is None or \
-            self._is_doc_start() or self._is_doc_end()
+    def _parse_doc(self):
+        self._begin_doc()
+        doc = self._parse_doc_content()
+        self._end_doc()
 
+        return doc
+
+
+    def _begin_doc(self):
+        self._anchors = {}
 
-    def _parse_doc(self):
         if self._is_doc_start():
             self._buf.next()
         self._buf.skip()
 
-        doc = None
-        if self._is_list_start():
-            doc = self._parse_list(self._indent_len())
-        elif self._is_dict_start():
-            doc = self._parse_dict(self._indent_len())
-        else:
-            self._handle_error('Unknown document format')
 
+    def _end_doc(self):
         if self._is_doc_end():
             self._buf.next()
         self._buf.skip()
 
+
+    def _parse_doc_content(self):
+        '''
+        A document with no content ('---' followed by comments, '...',
+        another '---' or the end of the file) is None, as in PyYAML.
+        '''
+        doc = None
+        if self._buf.eod():
+            pass
+        elif self._is_list_start():
+            doc = self._parse_list(self._buf.indent())
+        elif self._is_dict_start():
+            doc = self._parse_dict(self._buf.indent())
+        else:
+            self._handle_error('Unknown document format')
+
         return doc
 
 
     def _is_dict_start(self):
-        return re.fullmatch(r'[ ]*[^-\s].*?:(?:[ ]+.*)?', self._buf.line()) is not None
+        kind = self._buf.token().kind
+
+        return kind == DICT_ENTRY or kind == DICT_KEY
+
 
-    
     def _is_dict_key_valid(self, key):
         return ': ' not in key
 
 
     def _parse_dict_key(self, key):
+        if key[:1] != '\'' and key[:1] != '"':
+            if ': ' in key:
+                self._handle_error('A dictionary key must not contain \': \'')
+
+            return key.strip()
+
         if not self._is_quoted(key) and not self._is_dict_key_valid(key):
             self._handle_error('A dictionary key must not contain \': \'')
 
@@ -202,93 +910,204 @@ class YamlParser:
 
 
     def _parse_dict_entry(self, n):
-        entry = re.fullmatch(r'[ ]*([^-\s].*?):', self._buf.line())
-        if entry is not None:
-            k = self._parse_dict_key(entry[1])
-            v = None
+        token = self._buf.token()
 
-            self._buf.next()
-            self._buf.skip()
+        if token.kind == DICT_ENTRY:
+            k = _MERGE_KEY if token.key == '<<' else self._parse_dict_key(token.key)
 
-            indent_cmp = self._cmp_indent_len_to(n)
+            value = token.value
+            if token.is_scalar:
+                return (k, self._parse_scalar(n + 1, value))
 
-            if indent_cmp == self.GREATER_INDENT and self._is_dict_start():
-                v = self._parse_dict(self._indent_len())
-            elif indent_cmp != self.LESS_INDENT and self._is_list_start():
-                v = self._parse_list(self._indent_len())
-            elif indent_cmp == self.GREATER_INDENT and self._is_literal_start():
-                v = self._parse_literal(n + 1)
+            self._buf.add_offset(token.prefix)
+            if value[0] == '&' or value[0] == '*':
+                v = self._parse_properties(n, self._parse_dict_value)
             else:
-                self._handle_error('A dictionary entry must not be empty')
-                
+                v = self._parse_literal(n + 1)
+
             return (k, v)
 
-        entry = re.fullmatch(r'([ ]*([^-\s].*?):[ ]+)(?:.*)?', self._buf.line())
-        if entry is not None:
-            k = self._parse_dict_key(entry[2])
+        if token.kind == DICT_KEY:
+            k = _MERGE_KEY if token.key == '<<' else self._parse_dict_key(token.key)
 
-            self._buf.add_offset(len(entry[1]))
-            v = self._parse_literal(n + 1)
+            self._buf.advance()
 
-            return (k, v)
+            return (k, self._parse_dict_value(n))
 
         self._handle_error('Unknown type of dictionary entry')
 
 
+    def _parse_dict_value(self, n):
+        '''
+        Parses the value of a dictionary entry of indent n that starts on
+        the next line.
+        '''
+
+        if self._buf.closed():
+            self._handle_error('A dictionary entry must not be empty')
+
+        indent_cmp = self._cmp_indent_len_to(n)
+
+        if indent_cmp == self.GREATER_INDENT and self._is_dict_start():
+            return self._parse_dict(self._buf.indent())
+        elif indent_cmp != self.LESS_INDENT and self._is_list_start():
+            return self._parse_list(self._buf.indent())
+        elif indent_cmp == self.GREATER_INDENT and self._is_literal_start():
+            return self._parse_literal(n + 1)
+
+        self._handle_error('A dictionary entry must not be empty')
+
+
     def _parse_dict(self, n):
+        buf = self._buf
         entries = {}
+        merged = None
 
         k, v = self._parse_dict_entry(n)
-        entries[k] = v
-
-        while not self._is_eod():
-            match self._cmp_indent_len_to(n):
-                case self.EQUAL_INDENT:
-                    k, v = self._parse_dict_entry(n)
-                    if k not in entries:
-                        entries[k] = v
-                    else:
-                        self._handle_error(
-                            'All keys in a dictionary must have different names')
-                case self.GREATER_INDENT:
-                    self._handle_error('Wrong indent')
-                case self.LESS_INDENT:
-                    break
+        if k is _MERGE_KEY:
+            merged = self._merge(merged, v)
+        else:
+            entries[k] = v
+
+        while not buf.eod():
+            indent_len = buf.indent()
+
+            if indent_len == n:
+                k, v = self._parse_dict_entry(n)
+                if k is _MERGE_KEY:
+                    merged = self._merge(merged, v)
+                elif k not in entries:
+                    entries[k] = v
+                else:
+                    self._handle_error(
+                        'All keys in a dictionary must have different names')
+            elif indent_len > n:
+                self._handle_error('Wrong indent')
+            else:
+                break
+
+        if merged is not None:
+            merged.update(entries)
+            entries = merged
+
+        if self._builder is not None:
+            return self._builder.dict(entries)
 
         return entries
 
 
+    def _merge(self, merged, v):
+        '''
+        Adds the entries of a merge key value, a dictionary or a list of
+        dictionaries, to merged. Earlier dictionaries of the list take
+        precedence, and the dictionary's own keys are added over all of them
+        in _parse_dict; the key order is the one PyYAML produces. The values
+        are not copied, so they stay shared with the anchored nodes.
+        '''
+
+        if isinstance(v, Mapping):
+            sources = (v,)
+        elif isinstance(v, Sequence) and not isinstance(v, str) and \
+                all(isinstance(m, Mapping) for m in v):
+            sources = v
+        else:
+            self._handle_error('A merge key value must be a dictionary or a list of dictionaries')
+
+        if merged is None:
+            merged = {}
+
+        for m in reversed(sources):
+            merged.update(m.items())
+
+        return merged
+
+
+    def _parse_properties(self, n, parse_block):
+        '''
+        Parses an alias ('*name') or an anchored node ('&name value') that
+        starts at the current offset, in a collection of indent n. If the
+        anchor is the last thing on the line, the node is parsed from the
+        next lines by parse_block(n). An alias returns the anchored node
+        itself rather than a copy, so repeated nodes are built once and
+        shared by the tree.
+        '''
+
+        buf = self._buf
+        line = buf.line()
+        text = line.lstrip(' ')
+
+        name, _, rest = text[1:].partition(' ')
+        if name == '' or any(c in name for c in '[]{},'):
+            self._handle_error('Invalid anchor name')
+
+        if text[0] == '*':
+            if rest.strip() != '':
+                self._handle_error('An alias must not have a value')
+            if name not in self._anchors:
+                self._handle_error(f'Unknown anchor \'{name}\'')
+
+            buf.advance()
+
+            return self._anchors[name]
+
+        if rest.strip() == '':
+            buf.advance()
+            v = parse_block(n)
+        else:
+            buf.add_offset(len(line) - len(rest.lstrip(' ')))
+            if buf.token().text[:1] in ('&', '*'):
+                self._handle_error('A node must not have more than one anchor')
+            v = self._parse_literal(n + 1)
+
+        return self._anchor(name, v)
+
+
+    def _anchor(self, name, v):
+        '''
+        Registers v as the node of anchor name and returns it.
+        '''
+
+        if self._builder is not None:
+            v = self._builder.value(v)
+        self._anchors[name] = v
+
+        return v
+
+
+    def _alias(self, s):
+        '''
+        Resolves an alias inside a flow collection.
+        '''
+
+        name = s[1:]
+        if name not in self._anchors:
+            self._handle_error(f'Unknown anchor \'{name}\'')
+
+        return self._anchors[name]
+
+
     def _is_list_start(self):
-        return re.fullmatch(r'[ ]*-(?:[ ]+.*)?', self._buf.line()) is not None
+        kind = self._buf.token().kind
+
+        return kind == LIST_ENTRY or kind == LIST_EMPTY
 
 
     def _parse_list_entry(self, n):
-        entry = re.fullmatch(r'[ ]*-', self._buf.line())
-        if entry is not None:
-            self._buf.next()
-            self._buf.skip()
+        token = self._buf.token()
 
-            indent_cmp = self._cmp_indent_len_to(n)
+        if token.kind == LIST_EMPTY:
+            self._buf.advance()
 
-            v = None
-            if indent_cmp == self.GREATER_INDENT:
-                if self._is_dict_start():
-                    v = self._parse_dict(self._indent_len())
-                elif self._is_list_start():
-                    v = self._parse_list(self._indent_len())
-                elif self._is_literal_start():
-                    v = self._parse_literal(n + 1)
-            else:
-                self._handle_error('A list entry must not be empty')
-                
-            return v
+            return self._parse_list_value(n)
+
+        if token.kind == LIST_ENTRY:
+            self._buf.add_offset(token.prefix)
 
-        entry = re.fullmatch(r'([ ]*-[ ]+)(?:.*)?', self._buf.line())
-        if entry is not None:
-            self._buf.add_offset(len(entry[1]))
-            
             v = None
-            if self._is_dict_start():
+            c = self._buf.token().text[:1]
+            if c == '&' or c == '*':
+                v = self._parse_properties(n, self._parse_list_value)
+            elif self._is_dict_start():
                 v = self._parse_dict(self._buf.offset())
             elif self._is_list_start():
                 v = self._parse_list(self._buf.offset())
@@ -300,32 +1119,65 @@ class YamlParser:
         self._handle_error('Unknown type of list entry')
 
 
-    def _is_list_entry(self):
-        return self._buf.line().lstrip()[0] == '-'
+    def _parse_list_value(self, n):
+        '''
+        Parses the value of a list entry of indent n that starts on the
+        next line.
+        '''
 
+        indent_cmp = self._cmp_indent_len_to(n)
 
-    def _parse_list(self, n):
-        entries = []
-        entries.append(self._parse_list_entry(n))
+        v = None
+        if indent_cmp == self.GREATER_INDENT:
+            if self._is_dict_start():
+                v = self._parse_dict(self._buf.indent())
+            elif self._is_list_start():
+                v = self._parse_list(self._buf.indent())
+            elif self._is_literal_start():
+                v = self._parse_literal(n + 1)
+        else:
+            self._handle_error('A list entry must not be empty')
+
+        return v
 
-        while not self._is_eod():
-            match self._cmp_indent_len_to(n):
-                case self.EQUAL_INDENT:
-                    if not self._is_list_entry():
-                        break
 
-                    entries.append(self._parse_list_entry(n))
-                case self.GREATER_INDENT:
-                    self._handle_error('Wrong indent')
-                case self.LESS_INDENT:
+    def _iter_list(self, n):
+        '''
+        Yields the entries of a list of indent n one by one as they are
+        parsed.
+        '''
+
+        buf = self._buf
+        yield self._parse_list_entry(n)
+
+        while not buf.eod():
+            indent_len = buf.indent()
+
+            if indent_len == n:
+                if not buf.token().is_dash:
                     break
 
+                yield self._parse_list_entry(n)
+            elif indent_len > n:
+                self._handle_error('Wrong indent')
+            else:
+                break
+
+
+    def _parse_list(self, n):
+        entries = list(self._iter_list(n))
+
+        if self._builder is not None:
+            return self._builder.list(entries)
+
         return entries
 
 
-    
+
     def _is_quoted(self, s):
-        return re.fullmatch(r'\'.*\'|".*"', s.strip()) is not None
+        s = s.strip()
+
+        return len(s) >= 2 and s[0] in ('\'', '"') and s[-1] == s[0]
 
 
     def _unqoute_string(self, s):
@@ -333,13 +1185,12 @@ class YamlParser:
 
         if s.startswith('\''):
             if s.endswith('\''):
-                return s[1:-1]
+                return s[1:-1].replace('\'\'', '\'')
             else:
                 self._handle_error('A string has no closing single quote')
         elif s.startswith('"'):
             if s.endswith('"'):
-                # FIXME: Parse escape characters
-                return s[1:-1]
+                return _unescape(s[1:-1], self._handle_error)
             else:
                 self._handle_error('A string has no closing double quote')
         else:
@@ -347,144 +1198,347 @@ class YamlParser:
 
 
     def _is_literal_start(self):
-        # FIXME
-        return self._is_single_line_dict_start() or \
-            self._is_single_line_list_start() or self._is_string_part()
+        token = self._buf.token()
+
+        return token.flow is not None or token.is_string_part
 
 
     def _parse_literal(self, n):
-        # FIXME
-        if self._is_single_line_dict_start():
-            return self._parse_single_line_dict(n)
-        elif self._is_single_line_list_start():
-            return self._parse_single_line_list(n)
-        elif self._is_string_part():
+        token = self._buf.token()
+
+        if token.flow is not None:
+            return self._parse_flow()
+        elif token.is_string_part:
             return self._parse_string(n)
         else:
             self._handle_error('Unknown literal type')
 
 
-    def _is_single_line_list_start(self):
-        return self._buf.line().strip().startswith('[')
+    def _parse_flow(self):
+        '''
+        Parses a flow collection that starts at the current offset and
+        continues on the following lines up to its closing bracket.
+        '''
 
-    
-    def _is_single_line_list(self, s):
-        return s.startswith('[') and s.endswith(']')
+        buf = self._buf
+        start = buf.line_index()
 
+        def next_line():
+            buf.next()
+            if buf.closed() or buf.eod():
+                raise YamlError(f'Error at line {start}: '
+                    'A flow collection does not have a closing bracket')
 
-    def _is_empty_single_line_list(self, s):
-        return re.fullmatch(r'\[\s*\]', s) is not None
+            return buf.raw_line()
 
-    
-    def _parse_single_line_list(self, n):
-        s = self._parse_string(n).strip()
-        if self._is_single_line_list(s):
-            if self._is_empty_single_line_list(s):
-                return []
+        scanner = _FlowScanner(buf.raw_line()[buf.offset():], next_line,
+            self._anchor, self._alias, self._handle_error)
 
-            values = [self._unqoute_string(value) for value in s[1:-1].split(',')]
+        v = scanner.node()
+        if not scanner.at_end():
+            self._handle_error('Unexpected text after a flow collection')
 
-            return list(map(str.strip, values))
-        else:
-            self._handle_error('A single line list does not have a closing square bracket')
+        buf.advance()
 
+        return v
 
-    def _is_single_line_dict_start(self):
-        return self._buf.line().strip().startswith('{')
 
-    
-    def _is_single_line_dict(self, s):
-        return s.startswith('{') and s.endswith('}')
+    def _parse_string(self, n):
+        text = self._buf.token().text
 
+        if text[:1] == '|' or text[:1] == '>':
+            header = _BLOCK_HEADER.match(text)
+            if header is None:
+                self._handle_error('Invalid block scalar header')
 
-    def _is_empty_single_line_dict(self, s):
-        return re.fullmatch(r'\{\s*\}', s) is not None
+            return self._parse_block_scalar(n, header)
 
+        return self._parse_scalar(n, text)
 
-    def _parse_single_line_dict(self, n):
-        s = self._parse_string(n).strip()
-        if self._is_single_line_dict(s):
-            if self._is_empty_single_line_dict(s):
-                return {}
 
-            items = [tuple(map(str.strip, item.split(':'))) for item in s[1:-1].split(',')]
-            d = {}
-            for k, v in items:
-                d[self._parse_dict_key(k)] = self._unqoute_string(v).strip()
+    def _parse_scalar(self, n, string):
+        '''
+        Parses a plain scalar whose first line, string, is the current line,
+        joining it with the following lines of at least n spaces indent.
+        '''
 
-            return d
-        else:
-            self._handle_error('A single line list does not have a closing square bracket')
+        buf = self._buf
+        buf.advance()
 
+        parts = None
+        while not buf.eod() and buf.indent() >= n:
+            token = buf.token()
+            if not token.is_string_part:
+                break
 
-    def _is_string_part(self):
-        return ': ' not in self._buf.line() and self._buf.line()[-1] != ':' \
-            and not self._buf.line().startswith('- ')
+            if parts is None:
+                parts = [string]
+            parts.append(token.text)
+            buf.advance()
 
+        if parts is not None:
+            string = ' '.join(parts)
 
-    def _parse_string(self, n):
-        string = self._buf.line().strip()
-        if string == '>' or string == '|':
-            self._buf.next()
-            self._buf.skip()
+        if string[:1] != '\'' and string[:1] != '"':
+            return string
 
-        string = self._buf.line().strip()
-        self._buf.next()
-        self._buf.skip()
+        return self._unqoute_string(string)
 
-        while not self._is_eod():
-            match self._cmp_indent_len_to(n):
-                case self.LESS_INDENT:
-                    break
-                case _:
-                    if not self._is_string_part():
+
+    def _parse_block_scalar(self, n, header):
+        '''
+        Parses a literal ('|') or folded ('>') block scalar whose header is
+        the current line. Its content is the following raw lines indented by
+        at least n spaces (or by the indentation indicator relative to the
+        parent node); comments and spaces inside it are kept. The lines are
+        collected in a list and joined once, so the cost is linear in the
+        size of the scalar.
+        '''
+
+        buf = self._buf
+        style = header.group(1)
+        chomp = header.group(2) or header.group(5)
+        explicit = header.group(3) or header.group(4)
+
+        indent = n - 1 + int(explicit) if explicit else None
+        lines = []
+
+        buf.next()
+        while not buf.closed():
+            raw = buf.raw_line()
+            line_indent = len(raw) - len(raw.lstrip(' '))
+
+            if line_indent == len(raw):
+                lines.append(raw[indent:] if indent is not None else '')
+            else:
+                if indent is None:
+                    if line_indent < n:
                         break
+                    indent = line_indent
+                elif line_indent < indent:
+                    break
 
-                    string += ' ' + self._buf.line().strip()
-                    self._buf.next()
-                    self._buf.skip()
+                lines.append(raw[indent:])
 
-        return self._unqoute_string(string)
+            buf.next()
+
+        buf.skip()
+
+        end = len(lines)
+        while end != 0 and lines[end - 1] == '':
+            end -= 1
+        trailing = len(lines) - end
+        lines = lines[:end]
+
+        if style == '|':
+            text = '\n'.join(lines)
+        else:
+            text = self._fold_lines(lines)
+
+        if chomp == '-' or len(lines) == 0:
+            return text if chomp != '+' else text + '\n' * trailing
+        if chomp == '+':
+            return text + '\n' * (trailing + 1)
+
+        return text + '\n'
+
+
+    def _fold_lines(self, lines):
+        '''
+        Folds the lines of a '>' block scalar: a line break between two
+        lines is replaced with a space, a break followed by k empty lines
+        with k breaks, and breaks around more indented lines are kept.
+        '''
+
+        parts = []
+        empty = 0
+        prev_more = None
 
+        for line in lines:
+            if line == '':
+                empty += 1
+                continue
 
-def _inner_dump_xml(data, lvl, f):
-    if type(data) is str:
-        f.write('    ' * lvl + data + '\n')
-    elif type(data) is dict:
-        for k, v in data.items():
-            if v == {} or v == []:
-                f.write('    ' * lvl + f'<{k}></{k}>\n')
-            elif type(v) is str:
-                f.write('    ' * lvl + f'<{k}>{v}</{k}>\n')
+            more = line[0] == ' ' or line[0] == '\t'
+
+            if prev_more is None:
+                parts.append('\n' * empty)
+            elif more or prev_more:
+                parts.append('\n' * (empty + 1))
+            elif empty == 0:
+                parts.append(' ')
             else:
-                f.write('    ' * lvl + f'<{k}>\n')
-                _inner_dump_xml(v, lvl + 1, f)
-                f.write('    ' * lvl + f'</{k}>\n')
-    elif type(data) is list:
+                parts.append('\n' * empty)
+
+            parts.append(line)
+            empty = 0
+            prev_more = more
+
+        return ''.join(parts)
+
+
+def _inner_dump_xml(data, out):
+    '''
+    Works with any str, Mapping and Sequence, so both plain and compact
+    trees can be dumped. A node shared through aliases is written out each
+    time it is reached, without being copied in the tree.
+    '''
+
+    if isinstance(data, str):
+        out.text(data)
+        return
+
+    if data is None:
+        return
+
+    if isinstance(data, Mapping):
+        items = data.items()
+    else:
+        items = zip(itertools.repeat('value'), data)
+
+    for k, v in items:
+        if isinstance(v, str):
+            out.element(k, v)
+        elif v is not None and len(v) == 0:
+            out.element(k)
+        else:
+            out.start(k)
+            _inner_dump_xml(v, out)
+            out.end()
+
+
+def dump_document(data, out):
+    if data is None:
+        out.element('document')
+        return
+
+    out.start('document')
+    _inner_dump_xml(data, out)
+    out.end()
+
+
+def dump_xml(data, f, pretty=True, instr=None):
+    '''
+    Writes documents as XML. With instr, dumping each document is timed
+    as the 'serialize' phase; when data is a lazy iterator, parsing happens
+    between the documents and is not included.
+    '''
+
+    with XmlEmitter(f, pretty, instr=instr) as out:
+        out.declaration()
+        out.start('root')
+
+        dump = dump_document
+        if instr is not None:
+            dump = instr.timed('serialize', dump_document)
+
         for v in data:
-            if v == {} or v == []:
-                f.write('    ' * lvl + f'<value></value>\n')
-            elif type(v) is str:
-                f.write('    ' * lvl + f'<value>{v}</value>\n')
-            else:
-                f.write('    ' * lvl + '<value>\n')
-                _inner_dump_xml(v, lvl + 1, f)
-                f.write('    ' * lvl + '</value>\n')
+            dump(v, out)
+        out.end()
+
+
+_DOC_MARKER = re.compile(rb'^(---|\.\.\.)[ \t]*(?:#[^\n]*)?\r?$', re.MULTILINE)
+_CONTENT_LINE = re.compile(rb'^[ \t]*[^ \t\r\n#]', re.MULTILINE)
+
+
+def split_documents(data):
+    '''
+    Splits the UTF-8 encoded contents of a YAML file (bytes or mmap) at
+    document boundaries without parsing them. Yields pairs of the number of
+    lines before a document and the bytes of the document, which can be
+    parsed on their own with YamlParser.parse(chunk, line_offset=...).
+
+    A document starts at '---', at the start of the file or after '...',
+    and ends before the next '---' or after '...'. Parts holding nothing
+    but empty lines and comments are skipped, as the parser does.
+    '''
+
+    start = 0
+    line = 0
+    has_start = False
+
+    for match in _DOC_MARKER.finditer(data):
+        if match.group(1) == b'---':
+            end = match.start()
+        else:
+            end = data.find(b'\n', match.end())
+            end = len(data) if end == -1 else end + 1
 
+        chunk = bytes(data[start:end])
+        if has_start or _CONTENT_LINE.search(chunk) is not None:
+            yield (line, chunk)
 
-def dump_xml(data, f):
-    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-    f.write('<root>\n')
-    for v in data:
-        f.write('    ' + '<document>\n')
-        _inner_dump_xml(v, 2, f)
-        f.write('    ' + '</document>\n')
-    f.write('</root>\n')
+        line += chunk.count(b'\n')
+        start = end
+        has_start = match.group(1) == b'---'
 
+    chunk = bytes(data[start:])
+    if has_start or _CONTENT_LINE.search(chunk) is not None:
+        yield (line, chunk)
 
-def main():
-    with open('output/task3.xml', 'w') as out_file:
-        dump_xml(YamlParser().parse('input/timetable_task3.yaml'), out_file)
+
+def _parse_chunks(chunks):
+    parser = YamlParser()
+
+    return [doc for line, chunk in chunks for doc in parser.parse(chunk, line_offset=line)]
+
+
+def _group_chunks(chunks, group_size):
+    group = []
+    size = 0
+
+    for line, chunk in chunks:
+        group.append((line, chunk))
+        size += len(chunk)
+
+        if size >= group_size:
+            yield group
+            group = []
+            size = 0
+
+    if len(group) != 0:
+        yield group
+
+
+def parse_parallel(source, max_workers=None, group_size=1 << 18):
+    '''
+    Parses a multi-document YAML file (a path or its contents as bytes) in
+    a pool of max_workers processes and returns the same list as
+    YamlParser.parse. The file is split with split_documents and documents
+    are sent to workers in groups of about group_size bytes.
+    '''
+
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return []
+
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                return parse_parallel(data, max_workers, group_size)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    groups = _group_chunks(split_documents(source), group_size)
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        return [doc for docs in executor.map(_parse_chunks, groups) for doc in docs]
+
+
+def iter_documents(source, use_mmap=False, instr=None):
+    return YamlParser(instr=instr).iter_documents(source, use_mmap)
+
+
+def iter_items(source, use_mmap=False, instr=None):
+    return YamlParser(instr=instr).iter_items(source, use_mmap)
+
+
+def main(in_path='input/timetable_task3.yaml', out_path='output/task3.xml'):
+    with open(out_path, 'w') as out_file:
+        try:
+            dump_xml(iter_documents(in_path), out_file)
+        except YamlError as e:
+            print(e)
+            exit(1)
 
 
 if __name__ == '__main__':
@@ -1,23 +1,535 @@
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
 import time
+import tracemalloc
 
-from task0 import main as task0
-from task1 import main as task1
-from task2 import main as task2
-from task3 import main as task3
+import task0
+import task1
+import task2
+import task3
 
-def benchmark(name, task):
-    t = 0
-    n = 1000
 
-    for i in range(n):
-        start_time = time.time_ns()
-        task()
-        t += time.time_ns() - start_time
+class NullSink(io.RawIOBase):
+    '''
+    Двоичный приёмник, который только считает записанные байты, чтобы
+    запись на диск не влияла на измерения.
+    '''
 
-    print(f'{name}: {t // n}ns')
+    def __init__(self):
+        self.size = 0
 
+    def writable(self):
+        return True
 
-benchmark('Обязательное задание', task0)
-benchmark('Дополнительное задание 1', task1)
-benchmark('Дополнительное задание 2', task2)
-benchmark('Дополнительное задание 3', task3)
\ No newline at end of file
+    def write(self, b):
+        self.size += len(b)
+
+        return len(b)
+
+
+'''
+Движки: функция подготовки входных данных (не измеряется), функция
+разбора (None у однопроходных движков) и функция сериализации, которая
+получает результат разбора или подготовленные данные и пишет XML в
+приёмник (с отступами, если задан pretty).
+'''
+ENGINES = {
+    'task0': (
+        lambda text: text.splitlines(True),
+        None,
+        lambda lines, sink, pretty: task0.convert(lines, sink, pretty),
+    ),
+    'task1': (
+        lambda text: text,
+        task1.load_yaml,
+        lambda data, sink, pretty: task1.dump_xml(data, sink, pretty),
+    ),
+    'task1-events': (
+        lambda text: text,
+        None,
+        lambda text, sink, pretty: task1.convert_events(text, sink, pretty),
+    ),
+    'task2': (
+        lambda text: text.splitlines(True),
+        None,
+        lambda lines, sink, pretty: task2.convert(lines, sink, pretty),
+    ),
+    'task3': (
+        lambda text: text.encode('utf-8'),
+        lambda data: task3.YamlParser().parse(data),
+        lambda docs, sink, pretty: task3.dump_xml(docs, sink, pretty),
+    ),
+    'task3-compact': (
+        lambda text: text.encode('utf-8'),
+        lambda data: task3.YamlParser(compact=True).parse(data),
+        lambda docs, sink, pretty: task3.dump_xml(docs, sink, pretty),
+    ),
+}
+
+
+def _repeat_lines(unit, size):
+    '''
+    Повторяет строки unit, пока их суммарная длина не достигнет size.
+    '''
+
+    lines = []
+    written = 0
+
+    while written < size:
+        lines.extend(unit)
+        written += sum(map(len, unit))
+
+    return lines
+
+
+def generate_timetable(size):
+    '''
+    Возвращает синтетическое расписание из одного документа размером
+    не меньше size символов.
+    '''
+
+    with open('input/timetable.yaml', 'r') as in_file:
+        days = [line for line in in_file if line.rstrip() not in ('---', '...')]
+
+    return ''.join(['---\n'] + _repeat_lines(days, size) + ['...\n'])
+
+
+def generate_nested(size, depth=64, width=4):
+    '''
+    Возвращает список цепочек словарей глубины depth, на каждом уровне
+    которых находится width скалярных элементов.
+    '''
+
+    chain = ['- root:\n']
+    for level in range(depth):
+        indent = '  ' * (level + 2)
+        chain.extend(f'{indent}key{i}: value{i}\n' for i in range(width))
+        chain.append(f'{indent}level{level}:\n')
+    chain.append('  ' * (depth + 2) + 'leaf: value\n')
+
+    return ''.join(_repeat_lines(chain, size))
+
+
+def generate_wide(size, width=256):
+    '''
+    Возвращает список словарей с длинными однострочными и многострочными
+    списками из width элементов.
+    '''
+
+    values = ', '.join(f'value{i}' for i in range(width))
+
+    entry = ['- entry:\n', f'    flow: [{values}]\n', '    block:\n']
+    entry.extend(f'    - value{i}\n' for i in range(width))
+
+    return ''.join(_repeat_lines(entry, size))
+
+
+SHAPES = {
+    'timetable': generate_timetable,
+    'nested': generate_nested,
+    'wide': generate_wide,
+}
+
+
+def percentile(values, p):
+    '''
+    Возвращает p-й процентиль отсортированного списка values
+    (методом ближайшего ранга).
+    '''
+
+    rank = max(0, -(-len(values) * p // 100) - 1)
+
+    return values[int(rank)]
+
+
+def summarize(times):
+    times = sorted(times)
+
+    return {
+        'median': percentile(times, 50),
+        'p95': percentile(times, 95),
+        'p99': percentile(times, 99),
+        'min': times[0],
+        'max': times[-1],
+    }
+
+
+def run_once(engine, data, pretty=True):
+    '''
+    Выполняет одно преобразование и возвращает время разбора и
+    сериализации в секундах.
+    '''
+
+    _, parse, serialize = ENGINES[engine]
+
+    parse_time = 0
+    if parse is not None:
+        start_time = time.perf_counter()
+        data = parse(data)
+        parse_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    serialize(data, NullSink(), pretty)
+    serialize_time = time.perf_counter() - start_time
+
+    return parse_time, serialize_time
+
+
+def peak_memory(engine, data, pretty=True):
+    '''
+    Возвращает пиковый объём памяти в байтах, выделенной за одно
+    преобразование (без учёта входных данных).
+    '''
+
+    tracemalloc.start()
+    try:
+        run_once(engine, data, pretty)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def tree_memory(engine, data):
+    '''
+    Возвращает объём памяти в байтах, который занимает результат разбора
+    (только для движков с отдельным разбором).
+    '''
+
+    tracemalloc.start()
+    try:
+        tree = ENGINES[engine][1](data)
+        return tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+
+
+def generate(shape, size, depth=None):
+    '''
+    Возвращает вход формы shape размером не меньше size символов; depth
+    задаёт глубину вложенности для формы nested.
+    '''
+
+    if depth is None:
+        return SHAPES[shape](size)
+
+    return SHAPES[shape](size, depth)
+
+
+def benchmark(engine, shape, size, repeat, warmup, pretty=True, depth=None):
+    text = generate(shape, size, depth)
+    data = ENGINES[engine][0](text)
+    nb_bytes = len(text.encode('utf-8'))
+
+    for i in range(warmup):
+        run_once(engine, data, pretty)
+
+    parse_times = []
+    serialize_times = []
+    for i in range(repeat):
+        parse_time, serialize_time = run_once(engine, data, pretty)
+        parse_times.append(parse_time)
+        serialize_times.append(serialize_time)
+
+    total_times = [p + s for p, s in zip(parse_times, serialize_times)]
+    total = summarize(total_times)
+
+    result = {
+        'engine': engine,
+        'shape': shape,
+        'size': nb_bytes,
+        'runs': repeat,
+        'phases': {'total': total},
+        'throughput_mb_s': nb_bytes / total['median'] / 1e6,
+        'pretty': pretty,
+        'peak_memory': peak_memory(engine, data, pretty),
+    }
+
+    if depth is not None:
+        result['depth'] = depth
+
+    if ENGINES[engine][1] is not None:
+        result['phases']['parse'] = summarize(parse_times)
+        result['phases']['serialize'] = summarize(serialize_times)
+        result['tree_memory'] = tree_memory(engine, data)
+
+    return result
+
+
+'''
+Модули, функция main(in_path, out_path) которых запускается при замере
+пикового RSS. task1-events не указан отдельно: task1.main уже
+преобразует по событиям.
+'''
+RSS_MODULES = {
+    'task0': 'task0',
+    'task1': 'task1',
+    'task2': 'task2',
+    'task3': 'task3',
+}
+
+
+'''
+Код процесса замера RSS. Пик берётся из VmHWM в /proc: ru_maxrss
+дочернего процесса в Linux учитывает и память родителя до exec, а
+родитель держит сгенерированный вход.
+'''
+RSS_CODE = '''
+import {module}
+{module}.main({in_path!r}, {out_path!r})
+try:
+    with open('/proc/self/status') as f:
+        print(next(line.split()[1] for line in f if line.startswith('VmHWM:')))
+except OSError:
+    pass
+'''
+
+
+def peak_rss(module, in_path, out_path):
+    '''
+    Запускает module.main(in_path, out_path) в отдельном процессе и
+    возвращает его пиковый RSS в килобайтах. В отличие от peak_memory,
+    вход читается из файла самим преобразователем, поэтому видно,
+    растёт ли память с размером файла. Без /proc используется ru_maxrss
+    из wait4.
+    '''
+
+    code = RSS_CODE.format(module=module, in_path=in_path, out_path=out_path)
+    process = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, text=True)
+    output = process.stdout.read()
+    process.stdout.close()
+    _, status, usage = os.wait4(process.pid, 0)
+
+    if status != 0:
+        raise RuntimeError(f'{module} failed on {in_path}')
+
+    if output.strip() != '':
+        return int(output)
+
+    return usage.ru_maxrss
+
+
+def benchmark_memory(engines, shapes, sizes, depths):
+    '''
+    Замеряет пиковый RSS каждого движка из RSS_MODULES на файлах растущего
+    размера.
+    '''
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        in_path = os.path.join(tmp_dir, 'input.yaml')
+        out_path = os.path.join(tmp_dir, 'output.xml')
+
+        for shape in shapes:
+            for depth in (depths if shape == 'nested' else [None]):
+                for size in sizes:
+                    with open(in_path, 'w') as in_file:
+                        in_file.write(generate(shape, size, depth))
+                    nb_bytes = os.path.getsize(in_path)
+
+                    for engine in engines:
+                        if engine not in RSS_MODULES:
+                            continue
+
+                        rss = peak_rss(RSS_MODULES[engine], in_path, out_path)
+                        result = {'engine': engine, 'shape': shape, 'size': nb_bytes,
+                            'peak_rss_kib': rss}
+                        if depth is not None:
+                            result['depth'] = depth
+                        results.append(result)
+
+                        print(f'{engine} {shape}' + (f' depth {depth}' if depth is not None else '')
+                            + f' {nb_bytes}B: {rss}KiB RSS', file=sys.stderr)
+
+    return results
+
+
+'''
+Модули, время импорта которых проверяется, и тяжёлые модули, которые
+они не должны загружать при импорте: PyYAML, ElementTree, NumPy и пул
+процессов нужны только отдельным подкомандам и функциям.
+'''
+IMPORT_CHECKS = {
+    'cli': ('yaml', 'xml.etree', 'numpy', 'concurrent.futures', 'task1', 'task3'),
+    'task0': ('yaml', 'xml.etree', 'numpy', 'concurrent.futures'),
+    'task1': ('yaml', 'xml.etree', 'numpy', 'concurrent.futures'),
+    'task2': ('yaml', 'xml.etree', 'numpy', 'concurrent.futures'),
+    'task3': ('yaml', 'xml.etree', 'numpy', 'concurrent.futures'),
+    'task5': ('yaml', 'xml.etree', 'numpy', 'concurrent.futures'),
+}
+
+
+def import_time(module, runs=5):
+    '''
+    Импортирует module в отдельном интерпретаторе с -X importtime и
+    возвращает наименьшее за runs запусков суммарное время импорта в
+    микросекундах и множество загруженных при этом модулей. Байт-код
+    записывается, чтобы измерялась загрузка, а не компиляция.
+    '''
+
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+
+    best = None
+    for i in range(runs + 1):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+            capture_output=True, text=True, env=env, check=True)
+
+        imported = set()
+        total = None
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'cumulative' in line:
+                continue
+
+            _, cumulative, name = line.split('|')
+            name = name.strip()
+            imported.add(name)
+
+            if name == module:
+                total = int(cumulative)
+
+        '''
+        Первый запуск только записывает байт-код.
+        '''
+        if i != 0 and (best is None or total < best):
+            best = total
+
+    return best, imported
+
+
+def check_imports(budget):
+    '''
+    Проверяет, что модули из IMPORT_CHECKS не загружают тяжёлых модулей
+    и импортируются быстрее budget микросекунд. Возвращает результаты
+    и список нарушений.
+    '''
+
+    results = []
+    failures = []
+
+    for module, forbidden in IMPORT_CHECKS.items():
+        total, imported = import_time(module)
+        heavy = sorted(name for name in imported
+            if any(name == f or name.startswith(f + '.') for f in forbidden))
+
+        results.append({'module': module, 'import_time_us': total, 'forbidden': heavy})
+
+        if len(heavy) != 0:
+            failures.append(f'{module} imports {", ".join(heavy)}')
+        if total > budget:
+            failures.append(f'{module} takes {total}us to import (budget {budget}us)')
+
+        print(f'{module}: {total}us', file=sys.stderr)
+
+    return results, failures
+
+
+def parse_size(s):
+    '''
+    Разбирает размер вида 512, 64K, 1M или 1G.
+    '''
+
+    units = {'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+    if s[-1].upper() in units:
+        return int(s[:-1]) * units[s[-1].upper()]
+
+    return int(s)
+
+
+def report_result(result):
+    total = result['phases']['total']
+    print(f'{result["engine"]} {result["shape"]}'
+        + (f' depth {result["depth"]}' if 'depth' in result else '')
+        + f' {result["size"]}B: '
+        f'median {total["median"] * 1000:.2f}ms, '
+        f'p95 {total["p95"] * 1000:.2f}ms, '
+        f'{result["throughput_mb_s"]:.2f}MB/s, '
+        f'peak {result["peak_memory"] // 1024}KiB'
+        + (f', tree {result["tree_memory"] // 1024}KiB' if 'tree_memory' in result else ''),
+        file=sys.stderr)
+
+
+def run_benchmarks(args):
+    results = []
+
+    print(f'PyYAML backend: {task1.backend()}', file=sys.stderr)
+
+    for shape in args.shapes:
+        for depth in (args.depth if shape == 'nested' else [None]):
+            for size in args.sizes:
+                for engine in args.engines:
+                    try:
+                        result = benchmark(engine, shape, size, args.repeat, args.warmup,
+                            not args.compact, depth)
+                    except RecursionError:
+                        print(f'{engine} {shape} depth {depth}: recursion limit exceeded',
+                            file=sys.stderr)
+                        continue
+
+                    results.append(result)
+                    report_result(result)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the YAML to XML engines on synthetic timetables.')
+    parser.add_argument('-e', '--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('-s', '--shapes', nargs='+', choices=SHAPES, default=list(SHAPES))
+    parser.add_argument('--sizes', nargs='+', type=parse_size,
+        default=[parse_size(s) for s in ('1K', '32K', '1M')],
+        help='input sizes, e.g. 1K 1M 1G')
+    parser.add_argument('-d', '--depth', nargs='+', type=int, default=[64],
+        help='nesting depths of the nested shape, e.g. 10 100 1000')
+    parser.add_argument('-r', '--repeat', type=int, default=20)
+    parser.add_argument('-w', '--warmup', type=int, default=2)
+    parser.add_argument('--compact', action='store_true',
+        help='write XML without indentation')
+    parser.add_argument('-o', '--output', help='write JSON results to this file')
+    parser.add_argument('--rss', action='store_true',
+        help='measure the peak RSS of each engine\'s main() on generated files instead')
+    parser.add_argument('--imports', action='store_true',
+        help='check import time and imported modules instead of benchmarking')
+    parser.add_argument('--import-budget', type=int, default=50000,
+        help='maximum cumulative import time per module in microseconds')
+    args = parser.parse_args()
+
+    failures = []
+    if args.imports:
+        results, failures = check_imports(args.import_budget)
+    elif args.rss:
+        results = benchmark_memory(args.engines, args.shapes, args.sizes, args.depth)
+    else:
+        results = run_benchmarks(args)
+
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'yaml_backend': task1.backend(),
+        'results': results,
+    }
+
+    if args.output is None:
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    else:
+        with open(args.output, 'w') as out_file:
+            json.dump(report, out_file, indent=4)
+
+    for failure in failures:
+        print(failure, file=sys.stderr)
+
+    if len(failures) != 0:
+        exit(1)
+
+
+if __name__ == '__main__':
+    main()
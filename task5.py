@@ -1,36 +1,126 @@
 import csv
+from collections.abc import Mapping
 
+import task3
 
-with open('input/timetable.yaml', 'r') as in_file, open('output/task5.csv', 'w') as out_file:
-    writer = csv.writer(out_file, delimiter=';')
 
-    columns = ['lesson', 'day', 'type', 'weeks',
-        'start', 'end', 'teacher', 'building', 'room']
-    writer.writerow(columns)
+COLUMNS = ['lesson', 'day', 'type', 'weeks',
+    'start', 'end', 'teacher', 'building', 'room']
+
+'''
+Чётность недель занятия хранится битовой маской.
+'''
+EVEN_WEEK = 1
+ODD_WEEK = 2
+
+WEEK_PARITY = {
+    'Четная': EVEN_WEEK,
+    'Нечетная': ODD_WEEK,
+}
 
-    lesson_info = dict.fromkeys(columns)
 
-    for line in in_file:
-        if 'day:' in line:
+def iter_lessons(documents):
+    '''
+    Возвращает пары из названия дня и словаря занятия для всех занятий
+    документов расписания. Документ — список элементов day или один такой
+    элемент; пустые документы (None) пропускаются.
+    '''
+
+    for doc in documents:
+        if doc is None:
             continue
-        elif 'name:' in line:
-            lesson_info['day'] = line.strip().split(': ')[1]
-        elif 'lesson:' in line:
-            if None not in lesson_info.values():
-                writer.writerow(lesson_info.values())
-            lesson_info['lesson'] = line.strip()[2:].split(': ')[1]
+
+        if isinstance(doc, Mapping):
+            doc = [doc]
+
+        for entry in doc:
+            day = entry['day']
+            lessons = day.get('lessons') or ()
+
+            for lesson in lessons:
+                yield day['name'], lesson
+
+
+def parse_time(v):
+    '''
+    Переводит время вида '10:00' в минуты от начала суток. PyYAML читает
+    время без кавычек как шестидесятеричное число (10:00 -> 600), которое
+    уже равно числу минут.
+    '''
+
+    if isinstance(v, int):
+        return v
+
+    h, m = v.split(':')
+
+    return int(h) * 60 + int(m)
+
+
+def parse_weeks(v):
+    if isinstance(v, str):
+        v = [v]
+
+    mask = 0
+    for week in v:
+        try:
+            mask |= WEEK_PARITY[week]
+        except KeyError:
+            raise ValueError(f'Unknown week parity: {week}') from None
+
+    return mask
+
+
+def lesson_row(day, lesson, columns):
+    row = []
+
+    for c in columns:
+        if c == 'day':
+            v = day
         else:
-            for c in columns:
-                if c + ':' in line:
-                    v = line.strip().split(': ')[1]
+            v = lesson.get(c, '')
+
+            if not isinstance(v, str):
+                v = ','.join(map(str, v))
+
+        row.append(v)
+
+    return row
+
+
+def export_csv(source, out_file, columns=COLUMNS, batch_size=1024, use_mmap=False):
+    '''
+    Записывает занятия из YAML-файла source в CSV-поток out_file: заголовок
+    из columns и по строке на занятие. Элементы day списка верхнего уровня
+    разбираются по одному (task3.iter_items), а строки записываются пачками
+    по batch_size, поэтому в памяти находятся только текущий день и одна
+    пачка, даже если всё расписание — один документ.
+    '''
+
+    writer = csv.writer(out_file, delimiter=';')
+    writer.writerow(columns)
+
+    batch = []
+    for day, lesson in iter_lessons(task3.iter_items(source, use_mmap)):
+        batch.append(lesson_row(day, lesson, columns))
+
+        if len(batch) >= batch_size:
+            writer.writerows(batch)
+            batch.clear()
+
+    writer.writerows(batch)
+
 
-                    if (v.startswith('\'') and v.endswith('\'')) or \
-                            (v.startswith('"') and v.endswith('"')):
-                        v = v[1:-1]
-                    elif v.startswith('[') and v.endswith(']'):
-                        v = ','.join(v[1:-1].split(', '))
+def main(in_path='input/timetable.yaml', out_path='output/task5.csv'):
+    with open(out_path, 'w') as out_file:
+        try:
+            export_csv(in_path, out_file)
+        except task3.YamlError as e:
+            print(e)
+            exit(1)
+        except (KeyError, TypeError, AttributeError) as e:
+            print(f'Wrong timetable format: {type(e).__name__}: {e}')
+            exit(1)
 
-                    lesson_info[c] = v
 
-    writer.writerow(lesson_info.values())
-    
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+import io
+
+
+class XmlWriter:
+    '''
+    Буферизованный вывод XML. Фрагменты накапливаются в списке и
+    записываются в приёмник одним вызовом, когда их накопится chunk_size.
+    Отступы для каждой глубины вычисляются один раз.
+
+    line(depth, s) записывает строку с отступом, write(s) — фрагмент как
+    есть, flush() сбрасывает накопленное в приёмник.
+
+    Приёмником может быть текстовый поток (в том числе io.StringIO),
+    двоичный поток или bytearray; в двух последних случаях текст кодируется
+    в UTF-8.
+
+    Если передан instr (instrument.Instrument), время записи в приёмник
+    учитывается в фазе write, а объём в UTF-8 — в счётчике bytes_written.
+    '''
+
+    def __init__(self, sink, indent='    ', chunk_size=4096, instr=None):
+        self._indent = indent
+        self._indents = indents = ['']
+        chunk = []
+
+        if isinstance(sink, bytearray):
+            write = lambda s: sink.extend(s.encode('utf-8'))
+        elif isinstance(sink, (io.BufferedIOBase, io.RawIOBase)):
+            write = lambda s: sink.write(s.encode('utf-8'))
+        else:
+            write = sink.write
+
+        if instr is not None:
+            write = instr.timed('write', write)
+            write_counted = write
+
+            def write(s):
+                instr.count('bytes_written', len(s.encode('utf-8')))
+                write_counted(s)
+
+        def flush():
+            if len(chunk) != 0:
+                write(''.join(chunk))
+                chunk.clear()
+
+        def write_fragment(s):
+            chunk.append(s)
+
+            if len(chunk) >= chunk_size:
+                flush()
+
+        def line(depth, s):
+            try:
+                chunk.append(indents[depth] + s + '\n')
+            except IndexError:
+                chunk.append(self.prefix(depth) + s + '\n')
+
+            if len(chunk) >= chunk_size:
+                flush()
+
+        '''
+        Методы записи — замыкания над локальными переменными: они вызываются
+        для каждого элемента и так обходятся без поиска атрибутов.
+        '''
+        self.flush = flush
+        self.write = write_fragment
+        self.line = line
+
+    def prefix(self, depth):
+        '''
+        Возвращает отступ для данной глубины.
+        '''
+
+        while len(self._indents) <= depth:
+            self._indents.append(self._indents[-1] + self._indent)
+
+        return self._indents[depth]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()
+
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+
+def escape(s):
+    '''
+    Экранирует символы &, < и > в тексте элемента.
+    '''
+
+    if '&' in s:
+        s = s.replace('&', '&amp;')
+    if '<' in s:
+        s = s.replace('<', '&lt;')
+    if '>' in s:
+        s = s.replace('>', '&gt;')
+
+    return s
+
+
+class XmlEmitter:
+    '''
+    Потоковый вывод XML по событиям: start(tag) открывает элемент, end()
+    закрывает последний открытый, element(tag, text) записывает элемент
+    с текстом целиком, text(s) — текст без элемента. Текст экранируется.
+
+    В режиме pretty каждый элемент записывается на отдельной строке с
+    отступом, соответствующим глубине вложенности, поэтому отдельный проход
+    для расстановки отступов не нужен. Без него XML записывается без
+    отступов и переводов строк. depth задаёт начальную глубину для
+    фрагментов, которые вставляются внутрь другого документа. instr
+    передаётся XmlWriter.
+    '''
+
+    def __init__(self, sink, pretty=True, indent='    ', depth=0, chunk_size=4096, instr=None):
+        self._writer = writer = XmlWriter(sink, indent, chunk_size, instr)
+        stack = []
+
+        if pretty:
+            write_line = writer.line
+        else:
+            write = writer.write
+            write_line = lambda depth, s: write(s)
+
+        def start(tag):
+            write_line(depth + len(stack), f'<{tag}>')
+            stack.append(tag)
+
+        def end():
+            tag = stack.pop()
+            write_line(depth + len(stack), f'</{tag}>')
+
+        def element(tag, text=''):
+            write_line(depth + len(stack), f'<{tag}>{escape(text)}</{tag}>')
+
+        def text(s):
+            write_line(depth + len(stack), escape(s))
+
+        self.start = start
+        self.end = end
+        self.element = element
+        self.text = text
+        self.flush = writer.flush
+
+    def declaration(self):
+        self._writer.write(XML_DECLARATION)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.flush()